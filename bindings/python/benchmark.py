@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# micro-benchmarks for the python bindings. Each benchmark compares the
+# generic (list/dict based) interface against its batched counterpart.
+#
+# usage: benchmark.py [--baseline DIR] [benchmark ...]
+#
+# --baseline runs each benchmark a second time against the libtorrent module
+# found in DIR, e.g. a build from before a change, to compare against.
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import libtorrent as lt
+
+settings = {
+    'alert_mask': lt.alert.category_t.all_categories,
+    'alert_queue_size': 100000,
+    'enable_dht': False, 'enable_lsd': False, 'enable_natpmp': False,
+    'enable_upnp': False, 'listen_interfaces': '0.0.0.0:0'}
+
+
+def report(name, count, unit, elapsed):
+    print('%-40s %12.2f %s/s  (%g in %.3f s)' %
+          (name, count / elapsed if elapsed > 0 else 0, unit, count, elapsed))
+
+
+def fill_alert_queue(ses, n):
+    for i in range(n):
+        ses.post_session_stats()
+        ses.post_dht_stats()
+    ses.wait_for_alert(1000)
+    # give the network thread a chance to post all of them
+    time.sleep(0.5)
+
+
+def bench_alerts(rounds=20, batch=2000):
+    ses = lt.session(settings)
+    ses.pop_alerts()
+
+    count = 0
+    elapsed = 0.
+    for r in range(rounds):
+        fill_alert_queue(ses, batch)
+        start = time.perf_counter()
+        alerts = ses.pop_alerts()
+        count += sum(1 for a in alerts if isinstance(a, lt.session_stats_alert))
+        elapsed += time.perf_counter() - start
+    report('pop_alerts() + isinstance', count, 'alerts', elapsed)
+
+    buf = []
+    count = 0
+    elapsed = 0.
+    for r in range(rounds):
+        fill_alert_queue(ses, batch)
+        start = time.perf_counter()
+        count += ses.pop_alerts_into(buf, types=[lt.session_stats_alert])
+        elapsed += time.perf_counter() - start
+    report('pop_alerts_into(types=...)', count, 'alerts', elapsed)
+
+
+def make_data(directory, size):
+    # creates a file of the given size and returns a file_storage for it
+    name = os.path.join(directory, 'data')
+    with open(name, 'wb') as f:
+        for i in range(0, size, 1024 * 1024):
+            f.write(os.urandom(min(1024 * 1024, size - i)))
+    fs = lt.file_storage()
+    lt.add_files(fs, name)
+    return fs
+
+
+def make_seed(directory, size, piece_size=4 * 1024 * 1024):
+    # creates a file of the given size and returns a torrent_info for it
+    ct = lt.create_torrent(make_data(directory, size), piece_size)
+    lt.set_piece_hashes(ct, directory)
+    return lt.torrent_info(ct.generate())
+
+
+def bench_read_piece(rounds=5, size=256 * 1024 * 1024):
+    with tempfile.TemporaryDirectory() as directory:
+        ti = make_seed(directory, size)
+        ses = lt.session(settings)
+        h = ses.add_torrent({'ti': ti, 'save_path': directory,
+                             'flags': lt.torrent_flags.seed_mode})
+
+        for name, get in [('read_piece_alert.buffer', lambda a: a.buffer),
+                          ('read_piece_alert.buffer_view', lambda a: a.buffer_view)]:
+            total = 0
+            elapsed = 0.
+            for r in range(rounds):
+                for i in range(ti.num_pieces()):
+                    h.read_piece(i)
+                received = 0
+                while received < ti.num_pieces():
+                    ses.wait_for_alert(1000)
+                    # alerts are only valid until the next call to
+                    # pop_alerts(), so measure them one batch at a time
+                    alerts = [a for a in ses.pop_alerts() if isinstance(a, lt.read_piece_alert)]
+                    received += len(alerts)
+                    start = time.perf_counter()
+                    for a in alerts:
+                        total += len(get(a))
+                    elapsed += time.perf_counter() - start
+            report(name, total / 1e9, 'GB', elapsed)
+
+
+def bench_hash(rounds=3, size=1024 * 1024 * 1024):
+    with tempfile.TemporaryDirectory() as directory:
+        fs = make_data(directory, size)
+        progress = []
+
+        def hash_pieces(**kwargs):
+            ct = lt.create_torrent(fs, 1024 * 1024)
+            if kwargs:
+                lt.set_piece_hashes(ct, directory, callback=progress.append, **kwargs)
+            else:
+                lt.set_piece_hashes(ct, directory, progress.append)
+
+        cases = [('set_piece_hashes()', {}),
+                 ('set_piece_hashes(threads=1)', {'threads': 1})]
+        cores = os.cpu_count() or 1
+        if cores > 1:
+            cases.append(('set_piece_hashes(threads=%d)' % cores,
+                          {'threads': cores, 'read_ahead': 16 * 1024 * 1024}))
+
+        for name, kwargs in cases:
+            elapsed = 0.
+            for r in range(rounds):
+                start = time.perf_counter()
+                hash_pieces(**kwargs)
+                elapsed += time.perf_counter() - start
+            report(name, size * rounds / 1e6, 'MB', elapsed)
+
+
+def torrent_like(size):
+    # a structure shaped like a large .torrent file, about size bytes
+    # bencoded. Half of it is piece hashes, the rest is the file list
+    num_files = size // 2 // 40
+    return {b'announce': b'http://tracker.example.com/announce',
+            b'info': {b'name': b'benchmark', b'piece length': 16384,
+                      b'pieces': b'\xaa' * (size // 2 // 20 * 20),
+                      b'files': [{b'length': i, b'path': [b'dir', b'file-%d' % i]}
+                                 for i in range(num_files)]}}
+
+
+def bench_bencode(rounds=5, size=10 * 1000 * 1000):
+    torrent = torrent_like(size)
+    encoded = lt.bencode(torrent)
+
+    elapsed = 0.
+    for r in range(rounds):
+        start = time.perf_counter()
+        lt.bencode(torrent)
+        elapsed += time.perf_counter() - start
+    report('bencode()', len(encoded) * rounds / 1e6, 'MB', elapsed)
+
+    elapsed = 0.
+    for r in range(rounds):
+        start = time.perf_counter()
+        lt.bdecode(encoded)
+        elapsed += time.perf_counter() - start
+    report('bdecode()', len(encoded) * rounds / 1e6, 'MB', elapsed)
+
+
+def wait_for_added(ses, n):
+    added = 0
+    while added < n:
+        ses.wait_for_alert(1000)
+        added += sum(1 for a in ses.pop_alerts()
+                     if isinstance(a, lt.add_torrent_alert))
+
+
+def bench_startup(sizes=(1000, 10000, 50000)):
+    # like when restoring a session on startup. Measures both how long the
+    # calls block the caller, and the time until all torrents have been added
+    # (which is mostly spent in the network thread)
+    def add_one_by_one(ses, params):
+        for p in params:
+            ses.async_add_torrent(p)
+
+    def add_batch(ses, params):
+        ses.async_add_torrents(params)
+
+    for n in sizes:
+        params = [{'info_hashes': os.urandom(20), 'save_path': '.',
+                   'flags': lt.torrent_flags.paused} for i in range(n)]
+        sett = dict(settings, alert_mask=lt.alert.category_t.status_notification,
+                    alert_queue_size=2 * n)
+
+        for name, add in [('async_add_torrent()', add_one_by_one),
+                          ('async_add_torrents()', add_batch)]:
+            ses = lt.session(sett)
+            start = time.perf_counter()
+            add(ses, params)
+            returned = time.perf_counter()
+            wait_for_added(ses, n)
+            added = time.perf_counter()
+            report('%s x %d, call' % (name, n), n, 'torrents', returned - start)
+            report('%s x %d, added' % (name, n), n, 'torrents', added - start)
+            del ses
+
+
+benchmarks = {
+    'alerts': bench_alerts,
+    'bencode': bench_bencode,
+    'hash': bench_hash,
+    'read_piece': bench_read_piece,
+    'startup': bench_startup,
+}
+
+
+def run_baseline(name, directory):
+    # run the benchmark in a separate interpreter, importing libtorrent
+    # from the baseline directory
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [directory] + [p for p in [env.get('PYTHONPATH')] if p])
+    here = os.path.dirname(os.path.abspath(__file__))
+    ret = subprocess.call([sys.executable, '-c',
+                           'import benchmark; benchmark.benchmarks[%r]()' % name],
+                          cwd=here, env=env)
+    if ret != 0:
+        print('baseline failed, it may not support this benchmark')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='micro-benchmarks for the python bindings')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='one of: %s (default: all)' % ', '.join(sorted(benchmarks.keys())))
+    parser.add_argument('--baseline', metavar='DIR',
+                        help='also run each benchmark against the libtorrent module in DIR')
+    args = parser.parse_args()
+
+    names = args.benchmarks or sorted(benchmarks.keys())
+    for name in names:
+        if name not in benchmarks:
+            print('unknown benchmark "%s". available: %s'
+                  % (name, ', '.join(sorted(benchmarks.keys()))))
+            sys.exit(1)
+        print('=== %s' % name)
+        benchmarks[name]()
+        if args.baseline:
+            print('--- baseline (%s)' % args.baseline)
+            sys.stdout.flush()
+            run_baseline(name, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -133,23 +133,20 @@ def print_peer_info(console, peers):
     write_line(console, out)
 
 
+# maps block states to the character representing them
+block_state_chars = bytes.maketrans(b'\x00\x01\x02\x03', b' -=#')
+
+
 def print_download_queue(console, download_queue):
 
     out = ""
 
-    for e in download_queue:
-        out += '%4d: [' % e['piece_index']
-        for b in e['blocks']:
-            s = b['state']
-            if s == 3:
-                out += '#'
-            elif s == 2:
-                out += '='
-            elif s == 1:
-                out += '-'
-            else:
-                out += ' '
-        out += ']\n'
+    state = download_queue.state
+    first_block = download_queue.first_block
+    blocks_in_piece = download_queue.blocks_in_piece
+    for i, piece in enumerate(download_queue.piece_index):
+        blocks = bytes(state[first_block[i]:first_block[i] + blocks_in_piece[i]])
+        out += '%4d: [%s]\n' % (piece, blocks.translate(block_state_chars).decode())
 
     write_line(console, out)
 
@@ -161,11 +158,15 @@ def add_torrent(ses, filename, options):
     else:
         ti = lt.torrent_info(filename)
         resume_file = os.path.join(options.save_path, ti.name() + '.fastresume')
-        try:
-            atp = lt.read_resume_data(open(resume_file, 'rb').read())
-        except Exception as e:
-            print('failed to open resume file "%s": %s' % (resume_file, e))
-        atp.ti = ti
+        if os.path.exists(resume_file):
+            try:
+                with open(resume_file, 'rb') as f:
+                    atp = lt.read_resume_data(f.read())
+            except Exception as e:
+                print('failed to load resume file "%s": %s' % (resume_file, e))
+        # resume files may have been saved without the info dict
+        if atp.ti is None:
+            atp.ti = ti
 
     atp.save_path = options.save_path
     atp.storage_mode = lt.storage_mode_t.storage_mode_sparse
@@ -252,6 +253,15 @@ def main():
     for f in args:
         add_torrent(ses, f, options)
 
+    # restore the rest of the torrents from the last run, reading and decoding
+    # the resume files on all cores. The torrents added above are posted to
+    # the session first, so their resume files are only duplicates here, which
+    # the session ignores
+    if os.path.isdir(options.save_path):
+        for path, error in ses.load_resume_data(options.save_path,
+                                                threads=os.cpu_count() or 1):
+            print('failed to load resume file "%s": %s' % (path, error.message()))
+
     if os.name == 'nt':
         console = WindowsConsole()
     else:
@@ -294,7 +304,7 @@ def main():
             write_line(console, out)
 
             print_peer_info(console, t.handle.get_peer_info())
-            print_download_queue(console, t.handle.get_download_queue())
+            print_download_queue(console, t.handle.get_download_queue_packed())
 
             if t.state != lt.torrent_status.seeding:
                 try:
@@ -357,7 +367,9 @@ def main():
     for h, t in torrents.items():
         if not h.is_valid() or not t.has_metadata:
             continue
-        h.save_resume_data()
+        # include the metadata, to be able to restore the torrent from the
+        # resume file alone
+        h.save_resume_data(lt.torrent_handle.save_info_dict)
 
     while len(torrents) > 0:
         alerts = ses.pop_alerts()
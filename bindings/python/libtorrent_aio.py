@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+# asyncio integration for the libtorrent python bindings.
+#
+# The session notifies alert_loop through a socket registered with
+# session.set_alert_fd(), which is watched by the asyncio event loop. No
+# threads are involved.
+#
+#   import libtorrent as lt
+#   import libtorrent_aio
+#
+#   async def main():
+#       ses = lt.session({'alert_mask': lt.alert_category.status})
+#       loop = libtorrent_aio.alert_loop(ses)
+#       h = await loop.add_torrent({'ti': ti, 'save_path': '.'})
+#       alerts = loop.alerts()
+#       try:
+#           async for a in alerts:
+#               print(a.message())
+#       finally:
+#           await alerts.aclose()
+#       loop.close()
+#
+# loop.add_reader() is not supported by the proactor event loop, which is the
+# default on Windows. Use asyncio.WindowsSelectorEventLoopPolicy there.
+
+import asyncio
+import socket
+
+import libtorrent as lt
+
+
+def _info_hashes(params):
+    if isinstance(params, dict):
+        ti = params.get('ti')
+        ih = params.get('info_hashes')
+    else:
+        ti = params.ti
+        ih = params.info_hashes
+    if ti is not None:
+        return ti.info_hashes()
+    if isinstance(ih, (bytes, bytearray)):
+        if len(ih) == 32:
+            return lt.info_hash_t(lt.sha256_hash(bytes(ih)))
+        return lt.info_hash_t(lt.sha1_hash(bytes(ih)))
+    return ih
+
+
+class alert_loop:
+    """
+    Pops alerts from a session whenever it signals that new ones are
+    available, completes the futures returned by the awaitable helpers and
+    hands the alerts to the alerts() iterator.
+
+    The session's alert_mask must include the categories of the alerts the
+    helpers wait for (status for add_torrent() and storage for
+    save_resume_data() and read_piece()).
+    """
+
+    def __init__(self, ses, loop=None):
+        # must be constructed from within the event loop, unless one is
+        # passed in explicitly
+        self._ses = ses
+        self._loop = loop if loop is not None else asyncio.get_running_loop()
+        self._rsock, self._wsock = socket.socketpair()
+        self._rsock.setblocking(False)
+        self._wsock.setblocking(False)
+
+        # key -> list of futures, completed in the order they were created
+        self._waiters = {}
+
+        # the alerts() iterator, if any, and the alerts it has not yielded
+        # yet. Alerts are only valid until the next call to pop_alerts(), so
+        # we don't pop more until the iterator is done with this batch
+        self._iterating = False
+        self._holder = None
+        self._batch = []
+        self._wakeup = asyncio.Event()
+
+        ses.set_alert_fd(self._wsock.fileno())
+        self._loop.add_reader(self._rsock.fileno(), self._on_notify)
+
+    def close(self):
+        # stop the session from writing to the socket before closing it,
+        # otherwise the descriptor could be reused and written to
+        self._ses.set_alert_fd(-1)
+        self._loop.remove_reader(self._rsock.fileno())
+        self._rsock.close()
+        self._wsock.close()
+        for futures in self._waiters.values():
+            for f in futures:
+                f.cancel()
+        self._waiters = {}
+
+    def _on_notify(self):
+        try:
+            while self._rsock.recv(1024):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        # if the alerts() iterator hasn't finished with the previous batch,
+        # it will pop the new alerts once it's done
+        if self._holder is None and not self._batch:
+            self._pop()
+
+    def _pop(self):
+        alerts = self._ses.pop_alerts()
+        for a in alerts:
+            self._dispatch(a)
+        if self._iterating:
+            self._batch = alerts
+            self._wakeup.set()
+
+    def _complete(self, key, result=None, error=None):
+        futures = self._waiters.get(key)
+        if not futures:
+            return
+        f = futures.pop(0)
+        if not futures:
+            del self._waiters[key]
+        if f.cancelled():
+            return
+        if error is not None:
+            f.set_exception(error)
+        else:
+            f.set_result(result)
+
+    def _dispatch(self, a):
+        if isinstance(a, lt.add_torrent_alert):
+            key = ('add', _info_hashes(a.params))
+            if a.error.value() != 0:
+                self._complete(key, error=RuntimeError(a.error.message()))
+            else:
+                self._complete(key, a.handle)
+        elif isinstance(a, lt.save_resume_data_alert):
+            self._complete(('resume', a.handle), a.params)
+        elif isinstance(a, lt.save_resume_data_failed_alert):
+            self._complete(('resume', a.handle), error=RuntimeError(a.error.message()))
+        elif isinstance(a, lt.read_piece_alert):
+            key = ('piece', a.handle, a.piece)
+            if a.error.value() != 0:
+                self._complete(key, error=RuntimeError(a.error.message()))
+            else:
+                self._complete(key, a.buffer)
+
+    def _wait_for(self, key):
+        if self._holder is not None and self._holder is asyncio.current_task():
+            # the alert we're waiting for can't be popped until the
+            # alerts() iterator has been advanced
+            raise RuntimeError('cannot wait for an alert from within the alerts() '
+                               'loop, run it in a separate task instead')
+        f = self._loop.create_future()
+        self._waiters.setdefault(key, []).append(f)
+        return f
+
+    async def alerts(self):
+        """
+        yields every alert posted by the session. An alert is only valid
+        until the loop body asks for the next one.
+
+        If the loop is left early (with break, return or an exception), the
+        caller must aclose() the generator. Until it does, no more alerts are
+        popped and the futures returned by the other helpers won't complete.
+        """
+        if self._iterating:
+            raise RuntimeError('only one alerts() iterator can be active')
+        self._iterating = True
+        try:
+            while True:
+                self._wakeup.clear()
+                # pick up alerts that were posted while we were busy
+                self._pop()
+                while not self._batch:
+                    await self._wakeup.wait()
+                    self._wakeup.clear()
+                batch, self._batch = self._batch, []
+                self._holder = asyncio.current_task()
+                for a in batch:
+                    yield a
+                self._holder = None
+        finally:
+            self._iterating = False
+            self._holder = None
+            self._batch = []
+            # notifications that arrived while we held a batch were ignored,
+            # pick up those alerts now
+            self._pop()
+
+    async def add_torrent(self, params):
+        """
+        adds a torrent with session.async_add_torrent() and returns its
+        torrent_handle once it has been added
+        """
+        f = self._wait_for(('add', _info_hashes(params)))
+        self._ses.async_add_torrent(params)
+        return await f
+
+    async def save_resume_data(self, handle, flags=0):
+        """
+        returns the add_torrent_params with the torrent's resume data
+        """
+        f = self._wait_for(('resume', handle))
+        handle.save_resume_data(flags)
+        return await f
+
+    async def read_piece(self, handle, piece):
+        """
+        returns the contents of the piece, as bytes
+        """
+        f = self._wait_for(('piece', handle, piece))
+        handle.read_piece(piece)
+        return await f
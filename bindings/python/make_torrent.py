@@ -20,29 +20,13 @@ fs = libtorrent.file_storage()
 
 parent_input = os.path.split(input)[0]
 
-# if we have a single file, use it because os.walk does not work on a single files
-if os.path.isfile(input):
-    size = os.path.getsize(input)
-    fs.add_file(input, size)
-
-for root, dirs, files in os.walk(input):
-    # skip directories starting with .
-    if os.path.split(root)[1][0] == '.':
-        continue
-
-    for f in files:
-        # skip files starting with .
-        if f[0] == '.':
-            continue
-
-        # skip thumbs.db on windows
-        if f == 'Thumbs.db':
-            continue
-
-        fname = os.path.join(root[len(parent_input) + 1:], f)
-        size = os.path.getsize(os.path.join(parent_input, fname))
-        print('%10d kiB  %s' % (size / 1024, fname))
-        fs.add_file(fname, size)
+# scan the tree without calling back into python for every file, skipping
+# files and directories starting with . and thumbs.db on windows
+libtorrent.add_files(fs, input, ignore=['Thumbs.db'], ignore_hidden=True,
+                     threads=os.cpu_count() or 1)
+
+for i in range(fs.num_files()):
+    print('%10d kiB  %s' % (fs.file_size(i) / 1024, fs.file_path(i)))
 
 if fs.num_files() == 0:
     print('no files added')
@@ -53,9 +37,10 @@ t = libtorrent.create_torrent(fs, 0, 4 * 1024 * 1024)
 t.add_tracker(sys.argv[2])
 t.set_creator('libtorrent %s' % libtorrent.__version__)
 
-libtorrent.set_piece_hashes(t, parent_input, lambda x: sys.stdout.write('.'))
+# hash pieces on all cores, reporting progress every 64 pieces
+libtorrent.set_piece_hashes(
+    t, parent_input, threads=os.cpu_count() or 1, batch_size=64,
+    callback=lambda n: sys.stdout.write('\r%d/%d pieces' % (n, t.num_pieces())))
 sys.stdout.write('\n')
 
-f = open('out.torrent', 'wb+')
-f.write(libtorrent.bencode(t.generate()))
-f.close()
+t.write_to('out.torrent')
@@ -453,6 +453,7 @@ setuptools.setup(
     url="http://libtorrent.org",
     license="BSD",
     ext_modules=[StubExtension("libtorrent")],
+    py_modules=["libtorrent_aio"],
     cmdclass={
         "build_ext": LibtorrentBuildExt,
     },
@@ -10,6 +10,9 @@
 #include <libtorrent/operations.hpp>
 #include <memory>
 #include "bytes.hpp"
+#include "array.hpp"
+#include "buffer.hpp"
+#include "columns.hpp"
 #include "gil.hpp"
 
 #include <boost/type_traits/is_polymorphic.hpp>
@@ -29,6 +32,16 @@ bytes get_buffer(read_piece_alert const& rpa)
        : bytes();
 }
 
+// a read-only memoryview of the piece. It holds a reference to the buffer,
+// so it remains valid after the alert has been freed
+object get_buffer_view(read_piece_alert const& rpa)
+{
+    if (!rpa.buffer) return make_memoryview({}, 0);
+    boost::shared_array<char> const buf = rpa.buffer;
+    return make_memoryview(std::shared_ptr<char const>(buf.get()
+        , [buf](char const*) {}), std::size_t(rpa.size));
+}
+
 #if TORRENT_ABI_VERSION <= 2
 list stats_alert_transferred(stats_alert const& alert)
 {
@@ -51,6 +64,37 @@ list get_status_from_update_alert(state_update_alert const& alert)
    return result;
 }
 
+// a sequence view of state_update_alert::status, that doesn't copy the
+// torrent_status objects until they're accessed. Like the alert itself, it's
+// only valid until the next call to pop_alerts()
+struct status_sequence
+{
+   state_update_alert const* alert;
+
+   int len() const { return int(alert->status.size()); }
+
+   torrent_status getitem(int i) const
+   {
+      if (i < 0) i += len();
+      if (i < 0 || i >= len())
+      {
+         PyErr_SetString(PyExc_IndexError, "status index out of range");
+         throw_error_already_set();
+      }
+      return alert->status[std::size_t(i)];
+   }
+};
+
+status_sequence get_status_view(state_update_alert const& alert)
+{
+   return status_sequence{&alert};
+}
+
+dict update_alert_status_table(state_update_alert const& alert, object const& fields)
+{
+   return status_table(alert.status, fields);
+}
+
 list dht_stats_active_requests(dht_stats_alert const& a)
 {
    list result;
@@ -125,19 +169,33 @@ dict dht_put_item(dht_put_alert const& alert)
     return d;
 }
 
+// the set of metrics is fixed at compile time, there's no need to build it
+// for every alert
+std::vector<stats_metric> const& cached_stats_metrics()
+{
+    static std::vector<stats_metric> const map = session_stats_metrics();
+    return map;
+}
+
 dict session_stats_values(session_stats_alert const& alert)
 {
-    std::vector<stats_metric> map = session_stats_metrics();
     dict d;
     auto counters = alert.counters();
 
-    for (stats_metric const& m : map)
+    for (stats_metric const& m : cached_stats_metrics())
     {
         d[m.name] = counters[m.value_index];
     }
     return d;
 }
 
+// the raw counters, as an array.array of int64. Indexed by
+// stats_metric::value_index (or find_metric_idx())
+object session_stats_counters(session_stats_alert const& alert)
+{
+    return make_array(alert.counters());
+}
+
 list dht_live_nodes_nodes(dht_live_nodes_alert const& alert)
 {
     list result;
@@ -463,6 +521,7 @@ void bind_alert()
         .def_readonly("ec", &read_piece_alert::ec)
 #endif
         .add_property("buffer", get_buffer)
+        .add_property("buffer_view", get_buffer_view)
         .add_property("piece", make_getter(&read_piece_alert::piece, by_value()))
         .def_readonly("size", &read_piece_alert::size)
         ;
@@ -814,6 +873,13 @@ void bind_alert()
     class_<state_update_alert, bases<alert>, noncopyable>(
         "state_update_alert", no_init)
         .add_property("status", &get_status_from_update_alert)
+        .add_property("status_view", &get_status_view)
+        .def("status_table", &update_alert_status_table, (arg("fields")))
+        ;
+
+    class_<status_sequence>("status_sequence", no_init)
+        .def("__len__", &status_sequence::len)
+        .def("__getitem__", &status_sequence::getitem)
         ;
 
     class_<i2p_alert, bases<alert>, noncopyable>(
@@ -1071,6 +1137,7 @@ void bind_alert()
     class_<session_stats_alert, bases<alert>, noncopyable>(
         "session_stats_alert", no_init)
         .add_property("values", &session_stats_values)
+        .add_property("counters_view", &session_stats_counters)
         ;
 
     class_<session_stats_header_alert, bases<alert>, noncopyable>(
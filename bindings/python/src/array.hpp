@@ -0,0 +1,52 @@
+// Copyright Arvid Norberg 2021. Use, modification and distribution is
+// subject to the Boost Software License, Version 1.0. (See accompanying
+// file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+
+#ifndef ARRAY_HPP
+#define ARRAY_HPP
+
+#include "boost_python.hpp"
+#include <cstdint>
+
+// array.array, initialized by bind_converters()
+extern boost::python::object array_array;
+
+// maps element types to their array.array typecode
+template <typename T> struct array_typecode;
+template <> struct array_typecode<std::int8_t> { static char const* value() { return "b"; } };
+template <> struct array_typecode<std::uint8_t> { static char const* value() { return "B"; } };
+template <> struct array_typecode<std::int16_t> { static char const* value() { return "h"; } };
+template <> struct array_typecode<std::uint16_t> { static char const* value() { return "H"; } };
+template <> struct array_typecode<std::int32_t> { static char const* value() { return "i"; } };
+template <> struct array_typecode<std::uint32_t> { static char const* value() { return "I"; } };
+template <> struct array_typecode<std::int64_t> { static char const* value() { return "q"; } };
+template <> struct array_typecode<std::uint64_t> { static char const* value() { return "Q"; } };
+template <> struct array_typecode<float> { static char const* value() { return "f"; } };
+template <> struct array_typecode<double> { static char const* value() { return "d"; } };
+
+static_assert(sizeof(int) == 4, "array.array typecode 'i' is assumed to be 32 bits");
+static_assert(sizeof(long long) == 8, "array.array typecode 'q' is assumed to be 64 bits");
+
+// returns an array.array with a copy of the n elements starting at p. The
+// elements are copied in one go, without creating a python object for each
+template <typename T>
+boost::python::object make_array(T const* p, std::size_t const n)
+{
+    using namespace boost::python;
+    object ret = array_array(array_typecode<T>::value());
+    if (n == 0) return ret;
+
+    object mem(handle<>(PyMemoryView_FromMemory(
+        const_cast<char*>(reinterpret_cast<char const*>(p))
+        , Py_ssize_t(n * sizeof(T)), PyBUF_READ)));
+    ret.attr("frombytes")(mem);
+    return ret;
+}
+
+template <typename Container>
+boost::python::object make_array(Container const& c)
+{
+    return make_array(c.data(), std::size_t(c.size()));
+}
+
+#endif // ARRAY_HPP
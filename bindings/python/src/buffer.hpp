@@ -0,0 +1,186 @@
+// Copyright Arvid Norberg 2021. Use, modification and distribution is
+// subject to the Boost Software License, Version 1.0. (See accompanying
+// file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+
+#ifndef BUFFER_HPP
+#define BUFFER_HPP
+
+#include "boost_python.hpp"
+#include "array.hpp"
+#include <cstdint>
+#include <cstring>
+#include <memory>
+#include <new>
+#include <vector>
+
+// a python object exporting a read-only buffer owned by a shared_ptr. It's
+// used to hand out memoryviews of buffers allocated by libtorrent, without
+// copying them. The memory is kept alive for as long as the memoryview (or
+// any other view of the buffer) is
+struct shared_buffer_object
+{
+    PyObject_HEAD
+    std::shared_ptr<char const> data;
+    Py_ssize_t size;
+    // the struct module format of the elements, or nullptr for bytes
+    char const* format;
+    Py_ssize_t itemsize;
+    Py_ssize_t num_items;
+};
+
+inline int shared_buffer_getbuffer(PyObject* self, Py_buffer* view, int const flags)
+{
+    auto* b = reinterpret_cast<shared_buffer_object*>(self);
+    if (PyBuffer_FillInfo(view, self, const_cast<char*>(b->data.get())
+        , b->size, 1, flags) != 0)
+        return -1;
+    if (b->format == nullptr) return 0;
+
+    // this mirrors what array.array does
+    view->itemsize = b->itemsize;
+    if ((flags & PyBUF_FORMAT) == PyBUF_FORMAT)
+        view->format = const_cast<char*>(b->format);
+    if ((flags & PyBUF_ND) == PyBUF_ND)
+        view->shape = &b->num_items;
+    return 0;
+}
+
+inline void shared_buffer_dealloc(PyObject* self)
+{
+    auto* b = reinterpret_cast<shared_buffer_object*>(self);
+    b->data.~shared_ptr();
+    Py_TYPE(self)->tp_free(self);
+}
+
+inline PyTypeObject* shared_buffer_type()
+{
+    static PyBufferProcs procs = { &shared_buffer_getbuffer, nullptr };
+    static PyTypeObject type{};
+    static bool const initialized = []
+    {
+        // statically allocated types start out with one reference
+        reinterpret_cast<PyObject*>(&type)->ob_refcnt = 1;
+        type.tp_name = "libtorrent.shared_buffer";
+        type.tp_basicsize = sizeof(shared_buffer_object);
+        type.tp_dealloc = &shared_buffer_dealloc;
+        type.tp_flags = Py_TPFLAGS_DEFAULT;
+        type.tp_as_buffer = &procs;
+        type.tp_doc = "read-only buffer owned by libtorrent";
+        if (PyType_Ready(&type) < 0) boost::python::throw_error_already_set();
+        return true;
+    }();
+    static_cast<void>(initialized);
+    return &type;
+}
+
+// returns a read-only memoryview of the size bytes at data, holding a
+// reference to data
+inline boost::python::object make_memoryview(std::shared_ptr<char const> data
+    , std::size_t const size)
+{
+    using namespace boost::python;
+    PyTypeObject* t = shared_buffer_type();
+    handle<> owner(t->tp_alloc(t, 0));
+    auto* b = reinterpret_cast<shared_buffer_object*>(owner.get());
+    new (&b->data) std::shared_ptr<char const>(std::move(data));
+    b->size = Py_ssize_t(size);
+    return object(handle<>(PyMemoryView_FromObject(owner.get())));
+}
+
+// returns a read-only memoryview of the elements of v, with the same format
+// as an array.array of T. owner must keep v alive
+template <typename T, typename Owner>
+boost::python::object make_memoryview(std::shared_ptr<Owner> const& owner
+    , std::vector<T> const& v)
+{
+    using namespace boost::python;
+    PyTypeObject* t = shared_buffer_type();
+    handle<> exporter(t->tp_alloc(t, 0));
+    auto* b = reinterpret_cast<shared_buffer_object*>(exporter.get());
+    new (&b->data) std::shared_ptr<char const>(owner
+        , reinterpret_cast<char const*>(v.data()));
+    b->size = Py_ssize_t(v.size() * sizeof(T));
+    b->format = array_typecode<T>::value();
+    b->itemsize = Py_ssize_t(sizeof(T));
+    b->num_items = Py_ssize_t(v.size());
+    return object(handle<>(PyMemoryView_FromObject(exporter.get())));
+}
+
+// holds a read-only view of an object supporting the buffer protocol (bytes,
+// bytearray, memoryview, mmap etc.), releasing it when destructed. The
+// underlying memory is valid (and the exporter may not resize it) for the
+// lifetime of the buffer_view, which makes it safe to access without holding
+// the GIL
+struct buffer_view
+{
+    explicit buffer_view(PyObject* o, int const flags = PyBUF_SIMPLE)
+    {
+        if (PyObject_GetBuffer(o, &m_view, flags) != 0)
+            boost::python::throw_error_already_set();
+    }
+
+    buffer_view(buffer_view&& rhs) noexcept : m_view(rhs.m_view)
+    {
+        rhs.m_view.obj = nullptr;
+    }
+
+    buffer_view(buffer_view const&) = delete;
+    buffer_view& operator=(buffer_view const&) = delete;
+    buffer_view& operator=(buffer_view&&) = delete;
+
+    ~buffer_view() { PyBuffer_Release(&m_view); }
+
+    char const* data() const { return static_cast<char const*>(m_view.buf); }
+    std::size_t size() const { return std::size_t(m_view.len); }
+
+    // these are only set if requested by the flags passed to the constructor
+    char const* format() const { return m_view.format; }
+    std::size_t itemsize() const { return std::size_t(m_view.itemsize); }
+    int ndim() const { return m_view.ndim; }
+
+private:
+    Py_buffer m_view;
+};
+
+template <typename T, typename F>
+void for_each_element(buffer_view const& buf, F& f)
+{
+    char const* p = buf.data();
+    char const* const end = p + buf.size() / sizeof(T) * sizeof(T);
+    for (; p != end; p += sizeof(T))
+    {
+        T v;
+        std::memcpy(&v, p, sizeof(T));
+        f(std::int64_t(v));
+    }
+}
+
+// calls f with every element of a one-dimensional buffer of native integers,
+// such as an array.array or a numpy array. The buffer_view must have been
+// constructed with PyBUF_FORMAT. Returns false, without calling f, if the
+// buffer doesn't hold integers
+template <typename F>
+bool for_each_integer(buffer_view const& buf, F f)
+{
+    if (buf.ndim() > 1) return false;
+    // a missing format means unsigned bytes
+    char const* fmt = buf.format() ? buf.format() : "B";
+    if (*fmt == '@') ++fmt;
+    if (fmt[0] == '\0' || fmt[1] != '\0') return false;
+    switch (fmt[0])
+    {
+        case 'b': for_each_element<signed char>(buf, f); return true;
+        case 'B': for_each_element<unsigned char>(buf, f); return true;
+        case 'h': for_each_element<short>(buf, f); return true;
+        case 'H': for_each_element<unsigned short>(buf, f); return true;
+        case 'i': for_each_element<int>(buf, f); return true;
+        case 'I': for_each_element<unsigned int>(buf, f); return true;
+        case 'l': for_each_element<long>(buf, f); return true;
+        case 'L': for_each_element<unsigned long>(buf, f); return true;
+        case 'q': for_each_element<long long>(buf, f); return true;
+        case 'Q': for_each_element<unsigned long long>(buf, f); return true;
+        default: return false;
+    }
+}
+
+#endif // BUFFER_HPP
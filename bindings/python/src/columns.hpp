@@ -0,0 +1,64 @@
+// Copyright Arvid Norberg 2021. Use, modification and distribution is
+// subject to the Boost Software License, Version 1.0. (See accompanying
+// file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
+
+#ifndef COLUMNS_HPP
+#define COLUMNS_HPP
+
+#include "boost_python.hpp"
+#include "array.hpp"
+#include <libtorrent/torrent_status.hpp>
+#include <memory>
+#include <string>
+#include <vector>
+
+// one column of a table of Row objects (e.g. torrent_status or peer_info),
+// as returned by torrent_status_table() and peer_table(). The values are
+// collected without holding the GIL and converted to an array.array
+// afterwards
+template <typename Row>
+struct column
+{
+    virtual ~column() = default;
+    virtual void fill(std::vector<Row> const& rows) = 0;
+    virtual boost::python::object to_python() const = 0;
+};
+
+template <typename Row, typename T, typename F>
+struct column_impl final : column<Row>
+{
+    explicit column_impl(F f) : m_get(std::move(f)) {}
+
+    void fill(std::vector<Row> const& rows) override
+    {
+        m_values.reserve(rows.size());
+        for (Row const& r : rows)
+            m_values.push_back(m_get(r));
+    }
+
+    boost::python::object to_python() const override { return make_array(m_values); }
+
+private:
+    F m_get;
+    std::vector<T> m_values;
+};
+
+// T is the element type of the resulting array, and f is called with each
+// row to get the value
+template <typename Row, typename T, typename F>
+std::unique_ptr<column<Row>> make_column(F f)
+{
+    return std::unique_ptr<column<Row>>(new column_impl<Row, T, F>(std::move(f)));
+}
+
+// returns the column for the torrent_status field with the given name, or
+// raises KeyError. Defined in session.cpp
+std::unique_ptr<column<lt::torrent_status>> make_status_column(std::string const& name);
+
+// returns a dict mapping each of the requested torrent_status fields to an
+// array.array with one element per torrent. The special field "handle" is a
+// list of the torrent_handles. Defined in session.cpp
+boost::python::dict status_table(std::vector<lt::torrent_status> const& torrents
+    , boost::python::object const& fields);
+
+#endif // COLUMNS_HPP
@@ -3,6 +3,7 @@
 // file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
 
 #include "boost_python.hpp"
+#include "array.hpp"
 #include "libtorrent/socket.hpp"
 #include "libtorrent/address.hpp"
 #include "libtorrent/error_code.hpp"
@@ -30,6 +31,8 @@
 using namespace boost::python;
 namespace bp = boost::python;
 
+object array_array;
+
 template<class T>
 struct endpoint_to_tuple
 {
@@ -403,6 +406,8 @@ struct to_bitfield_flag
 
 void bind_converters()
 {
+    array_array = import("array").attr("array");
+
     // C++ -> python conversions
     to_python_converter<std::pair<int, int>, pair_to_tuple<int, int>>();
     to_python_converter<std::pair<lt::piece_index_t, lt::download_priority_t>, pair_to_tuple<lt::piece_index_t, lt::download_priority_t>>();
@@ -547,6 +552,7 @@ void bind_converters()
     to_bitfield_flag<lt::create_flags_t>();
     to_bitfield_flag<lt::pex_flags_t>();
     to_bitfield_flag<lt::reannounce_flags_t>();
+    to_bitfield_flag<lt::file_progress_flags_t>();
     to_string_view();
     to_bitfield_flag<lt::session_flags_t>();
 }
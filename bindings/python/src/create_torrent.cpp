@@ -7,6 +7,16 @@
 #include <libtorrent/file_storage.hpp>
 #include "libtorrent/torrent_info.hpp"
 #include <libtorrent/version.hpp>
+#include <libtorrent/settings_pack.hpp>
+#include <libtorrent/bdecode.hpp>
+#include <libtorrent/bencode.hpp>
+#include <libtorrent/entry.hpp>
+#include <algorithm>
+#include <iterator>
+#include <string>
+#include <map>
+#include <thread>
+#include <vector>
 #include "bytes.hpp"
 #include "gil.hpp"
 
@@ -55,6 +65,335 @@ namespace
     }
 #endif
 
+    // remembers the piece hashes computed by set_piece_hashes(), so that
+    // pieces of files that haven't changed since a previous run can be reused
+    // instead of being read and hashed again. v1 piece hashes are keyed by the
+    // (path, size, mtime, offset) of the file ranges the piece spans. v2
+    // hashes are kept per file, keyed by its (path, size, mtime) and the piece
+    // size. They are the file's piece layer, which is all its merkle tree is
+    // built from
+    struct hash_cache
+    {
+        std::map<std::string, sha1_hash> pieces;
+        std::map<std::string, std::vector<sha256_hash>> files;
+
+        // the number of pieces reused and hashed, respectively, by the last
+        // call to set_piece_hashes() using this cache
+        int hits = 0;
+        int misses = 0;
+    };
+
+    bytes hash_cache_save(hash_cache const& hc)
+    {
+        entry e;
+        entry::dictionary_type& pieces = e["pieces"].dict();
+        for (auto const& p : hc.pieces)
+            pieces[p.first] = p.second.to_string();
+        entry::dictionary_type& files = e["files"].dict();
+        for (auto const& f : hc.files)
+        {
+            std::string layer;
+            for (auto const& h : f.second) layer.append(h.data(), h.size());
+            files[f.first] = std::move(layer);
+        }
+        std::string ret;
+        bencode(std::back_inserter(ret), e);
+        return ret;
+    }
+
+    void hash_cache_load(hash_cache& hc, bytes const& buf)
+    {
+        bdecode_node const e = bdecode(buf.arr);
+        if (e.type() != bdecode_node::dict_t)
+        {
+            PyErr_SetString(PyExc_ValueError, "invalid hash cache");
+            throw_error_already_set();
+        }
+
+        hc.pieces.clear();
+        hc.files.clear();
+        bdecode_node const pieces = e.dict_find_dict("pieces");
+        for (int i = 0; pieces && i < pieces.dict_size(); ++i)
+        {
+            auto const p = pieces.dict_at(i);
+            if (p.second.type() != bdecode_node::string_t
+                || p.second.string_length() != int(sha1_hash::size()))
+                continue;
+            hc.pieces[std::string(p.first)] = sha1_hash(p.second.string_ptr());
+        }
+        bdecode_node const files = e.dict_find_dict("files");
+        for (int i = 0; files && i < files.dict_size(); ++i)
+        {
+            auto const f = files.dict_at(i);
+            if (f.second.type() != bdecode_node::string_t
+                || f.second.string_length() % int(sha256_hash::size()) != 0)
+                continue;
+            std::vector<sha256_hash> layer;
+            char const* h = f.second.string_ptr();
+            char const* const end = h + f.second.string_length();
+            for (; h != end; h += sha256_hash::size())
+                layer.emplace_back(h);
+            hc.files[std::string(f.first)] = std::move(layer);
+        }
+    }
+
+    void hash_cache_clear(hash_cache& hc)
+    {
+        hc.pieces.clear();
+        hc.files.clear();
+    }
+
+    std::size_t hash_cache_len(hash_cache const& hc)
+    {
+        return hc.pieces.size() + hc.files.size();
+    }
+
+    // returns the (path, size, mtime) part of the cache key of every file. The
+    // key is empty for files that can't be stat'ed, which are always hashed
+    std::vector<std::string> file_keys(file_storage const& fs, std::string const& p)
+    {
+        object stat = import("os").attr("stat");
+        std::vector<std::string> ret(std::size_t(fs.num_files()));
+        for (file_index_t const i : fs.file_range())
+        {
+            std::string& k = ret[std::size_t(static_cast<int>(i))];
+            if (fs.pad_file_at(i))
+            {
+                // pad files aren't read from disk. The leading zero makes
+                // sure it doesn't collide with a path
+                k.assign(1, '\0');
+                k += std::to_string(fs.file_size(i));
+                continue;
+            }
+            std::string const path = fs.file_path(i, p);
+            object st;
+            try
+            {
+                st = stat(path);
+            }
+            catch (error_already_set const&)
+            {
+                if (!PyErr_ExceptionMatches(PyExc_OSError)) throw;
+                PyErr_Clear();
+                continue;
+            }
+            k = path;
+            k += '\0';
+            k += std::to_string(extract<std::int64_t>(st.attr("st_size"))());
+            k += '\0';
+            k += std::to_string(extract<std::int64_t>(st.attr("st_mtime_ns"))());
+        }
+        return ret;
+    }
+
+    // hashes the pieces on threads (threads = 0 means the same default as the
+    // C++ set_piece_hashes()), reading read_ahead bytes ahead, without
+    // holding the GIL. The callback is called with the number of pieces
+    // hashed so far, every batch_size pieces and once all are done, rather
+    // than once per piece. If a hash_cache is passed, pieces found in it are
+    // not hashed, and the cache is updated with the hashes of all pieces
+    void set_piece_hashes_parallel(create_torrent& c, std::string const& p
+        , object cb, int const threads, int const read_ahead, int const batch_size
+        , object cache)
+    {
+        settings_pack sett = default_settings();
+        sett.set_int(settings_pack::hashing_threads, threads > 0 ? threads
+            : std::max(1, static_cast<int>(std::thread::hardware_concurrency() / 2)));
+        sett.set_int(settings_pack::checking_mem_usage
+            , std::max(1, (read_ahead > 0 ? read_ahead : 1024 * 1024) / default_block_size));
+
+        file_storage const& fs = c.files();
+        int num_pieces = c.num_pieces();
+
+        hash_cache* hc = cache.is_none() ? nullptr : &extract<hash_cache&>(cache)();
+        // the cache keys of the pieces (v1) and files (v2) that can be cached
+        std::vector<std::string> piece_keys;
+        std::vector<std::string> file_layer_keys;
+        std::vector<bool> cached;
+        std::function<bool(piece_index_t)> skip;
+        if (hc != nullptr)
+        {
+            std::vector<std::string> const names = file_keys(fs, p);
+            cached.assign(std::size_t(c.num_pieces()), true);
+
+            if (!c.is_v1_only())
+            {
+                file_layer_keys.resize(names.size());
+                for (file_index_t const i : fs.file_range())
+                {
+                    std::size_t const idx = std::size_t(static_cast<int>(i));
+                    int const file_pieces = fs.file_num_pieces(i);
+                    if (fs.pad_file_at(i) || file_pieces == 0) continue;
+                    int const first = int(fs.file_offset(i) / c.piece_length());
+                    if (!names[idx].empty())
+                    {
+                        std::string& k = file_layer_keys[idx];
+                        k = names[idx];
+                        k += '\0';
+                        k += std::to_string(c.piece_length());
+                        auto const it = hc->files.find(k);
+                        if (it != hc->files.end() && int(it->second.size()) == file_pieces)
+                        {
+                            for (int j = 0; j < file_pieces; ++j)
+                                c.set_hash2(i, piece_index_t::diff_type(j), it->second[std::size_t(j)]);
+                            continue;
+                        }
+                    }
+                    for (int j = 0; j < file_pieces; ++j)
+                        cached[std::size_t(first + j)] = false;
+                }
+            }
+
+            if (!c.is_v2_only())
+            {
+                piece_keys.resize(std::size_t(c.num_pieces()));
+                for (piece_index_t const i : fs.piece_range())
+                {
+                    std::size_t const idx = std::size_t(static_cast<int>(i));
+                    std::string& k = piece_keys[idx];
+                    for (auto const& slice : fs.map_block(i, 0, c.piece_size(i)))
+                    {
+                        std::string const& name = names[std::size_t(static_cast<int>(slice.file_index))];
+                        if (name.empty())
+                        {
+                            k.clear();
+                            break;
+                        }
+                        k += name;
+                        k += '\0';
+                        k += std::to_string(slice.offset);
+                        k += '\0';
+                        k += std::to_string(slice.size);
+                        k += '\0';
+                    }
+                    auto const it = k.empty() ? hc->pieces.end() : hc->pieces.find(k);
+                    if (it != hc->pieces.end()) c.set_hash(i, it->second);
+                    else cached[idx] = false;
+                }
+            }
+
+            num_pieces = int(std::count(cached.begin(), cached.end(), false));
+            hc->hits = c.num_pieces() - num_pieces;
+            hc->misses = num_pieces;
+            skip = [&](piece_index_t const i)
+            { return bool(cached[std::size_t(static_cast<int>(i))]); };
+        }
+
+        int const batch = std::max(1, batch_size);
+        int done = 0;
+        // the C++ set_piece_hashes() always calls the callback
+        std::function<void(piece_index_t)> f = [](piece_index_t) {};
+        if (!cb.is_none())
+        {
+            f = [&](piece_index_t)
+            {
+                ++done;
+                if (done % batch != 0 && done != num_pieces) return;
+                lock_gil lock;
+                cb(done);
+            };
+        }
+
+        error_code ec;
+        {
+            allow_threading_guard guard;
+            set_piece_hashes(c, p, sett, skip, f, ec);
+        }
+#ifndef BOOST_NO_EXCEPTIONS
+        if (ec) throw system_error(ec);
+#endif
+        if (hc == nullptr || ec) return;
+
+        for (std::size_t i = 0; i < piece_keys.size(); ++i)
+        {
+            if (piece_keys[i].empty()) continue;
+            hc->pieces[piece_keys[i]] = c.hash(piece_index_t(int(i)));
+        }
+        for (std::size_t i = 0; i < file_layer_keys.size(); ++i)
+        {
+            if (file_layer_keys[i].empty()) continue;
+            file_index_t const file{static_cast<int>(i)};
+            std::vector<sha256_hash> layer;
+            for (auto const j : fs.file_piece_range(file))
+                layer.push_back(c.hash2(file, j));
+            hc->files[file_layer_keys[i]] = std::move(layer);
+        }
+    }
+
+    // buffers the output of bencode() and passes it to a python file object's
+    // write() in chunks, so the .torrent file is never held in memory in full
+    struct chunked_writer
+    {
+        static constexpr std::size_t chunk_size = 1024 * 1024;
+
+        explicit chunked_writer(object f) : file(std::move(f))
+        { buf.reserve(chunk_size); }
+
+        void flush()
+        {
+            if (buf.empty()) return;
+            file.attr("write")(object(handle<>(
+                PyBytes_FromStringAndSize(buf.data(), Py_ssize_t(buf.size())))));
+            total += std::int64_t(buf.size());
+            buf.clear();
+        }
+
+        object file;
+        std::string buf;
+        std::int64_t total = 0;
+    };
+
+    struct chunked_iterator
+    {
+        using iterator_category = std::output_iterator_tag;
+        using value_type = void;
+        using difference_type = void;
+        using pointer = void;
+        using reference = void;
+
+        chunked_iterator& operator*() { return *this; }
+        chunked_iterator& operator++() { return *this; }
+        chunked_iterator& operator++(int) { return *this; }
+        chunked_iterator& operator=(char const c)
+        {
+            w->buf.push_back(c);
+            if (w->buf.size() >= chunked_writer::chunk_size) w->flush();
+            return *this;
+        }
+
+        chunked_writer* w;
+    };
+
+    // generates the torrent and bencodes it straight into f, which is either
+    // a path or a file object opened in binary mode. Returns the number of
+    // bytes written. create_torrent only knows how to generate() an entry, so
+    // the whole entry (including the piece layers) is still built in memory
+    // first. What's saved is the python objects and the bencoded buffer
+    std::int64_t write_to(create_torrent const& ct, object f)
+    {
+        entry e;
+        {
+            allow_threading_guard guard;
+            e = ct.generate();
+        }
+
+        bool const is_path = PyUnicode_Check(f.ptr()) || PyBytes_Check(f.ptr())
+            || PyObject_HasAttrString(f.ptr(), "__fspath__");
+        chunked_writer w(is_path ? import("builtins").attr("open")(f, "wb") : f);
+        try
+        {
+            bencode(chunked_iterator{&w}, e);
+            w.flush();
+        }
+        catch (...)
+        {
+            if (is_path) w.file.attr("close")();
+            throw;
+        }
+        if (is_path) w.file.attr("close")();
+        return w.total;
+    }
+
     void add_node(create_torrent& ct, std::string const& addr, int port)
     {
         ct.add_node(std::make_pair(addr, port));
@@ -115,6 +454,82 @@ namespace
         add_files(fs, file, [&](std::string const& i) { return cb(i); }, flags);
     }
 
+    // matches name against a shell-style pattern, where * matches any number
+    // of characters and ? any single character
+    bool glob_match(char const* pattern, char const* name)
+    {
+        // where to resume matching if the last * needs to match more
+        char const* star = nullptr;
+        char const* retry = nullptr;
+        while (*name != '\0')
+        {
+            if (*pattern == '*')
+            {
+                star = ++pattern;
+                retry = name;
+            }
+            else if (*pattern != '\0' && (*pattern == '?' || *pattern == *name))
+            {
+                ++pattern;
+                ++name;
+            }
+            else if (star != nullptr)
+            {
+                pattern = star;
+                name = ++retry;
+            }
+            else
+            {
+                return false;
+            }
+        }
+        while (*pattern == '*') ++pattern;
+        return *pattern == '\0';
+    }
+
+    // scans the directory without calling into python. Files and directories
+    // whose name match any of the ignore patterns (or start with a dot, if
+    // ignore_hidden is set) are skipped
+    void add_files_native(file_storage& fs, std::string const& file
+        , create_flags_t const flags, object ignore, bool const ignore_hidden
+        , int const threads)
+    {
+        std::vector<std::string> patterns;
+        if (!ignore.is_none())
+        {
+            stl_input_iterator<std::string> i(ignore), end;
+            patterns.assign(i, end);
+        }
+
+        // the first path passed to the predicate is the one we were asked to
+        // add. It's exempt from the rules, so it's fine to add a hidden
+        // directory. The other paths are only passed once it has returned
+        bool root = true;
+        auto pred = [&](std::string const& path)
+        {
+            if (root)
+            {
+                root = false;
+                return true;
+            }
+#ifdef TORRENT_WINDOWS
+            std::size_t const sep = path.find_last_of("\\/");
+#else
+            std::size_t const sep = path.find_last_of('/');
+#endif
+            char const* name = path.c_str() + (sep == std::string::npos ? 0 : sep + 1);
+            if (ignore_hidden && name[0] == '.') return false;
+            for (auto const& p : patterns)
+                if (glob_match(p.c_str(), name)) return false;
+            return true;
+        };
+
+        int const num_threads = threads > 0 ? threads
+            : std::max(1, static_cast<int>(std::thread::hardware_concurrency()));
+        allow_threading_guard guard;
+        add_files(fs, file, pred, flags, num_threads);
+    }
+
     void add_file(file_storage& fs, std::string const& file, std::int64_t size
        , file_flags_t const flags, std::time_t md, std::string link)
     {
@@ -205,6 +620,7 @@ void bind_create_torrent()
             , arg("flags") = create_flags_t{})))
 
         .def("generate", &create_torrent::generate)
+        .def("write_to", &write_to, (arg("file")))
 
         .def("files", &create_torrent::files, return_internal_reference<>())
         .def("set_comment", &create_torrent::set_comment)
@@ -253,9 +669,27 @@ void bind_create_torrent()
         s.attr("symlinks") = create_torrent::symlinks;
     }
 
+    // this overload is tried last, so it's only used when any of the keyword
+    // arguments are passed
+    def("add_files", add_files_native, (arg("fs"), arg("path"), arg("flags") = 0
+        , arg("ignore") = object(), arg("ignore_hidden") = false, arg("threads") = 0));
     def("add_files", add_files0, (arg("fs"), arg("path"), arg("flags") = 0));
     def("add_files", add_files_callback, (arg("fs"), arg("path")
         , arg("predicate"), arg("flags") = 0));
+    class_<hash_cache>("hash_cache")
+        .def("save", &hash_cache_save)
+        .def("load", &hash_cache_load, (arg("buf")))
+        .def("clear", &hash_cache_clear)
+        .def("__len__", &hash_cache_len)
+        .def_readonly("hits", &hash_cache::hits)
+        .def_readonly("misses", &hash_cache::misses)
+        ;
+
+    // this overload is tried last, so it's only used when any of the keyword
+    // arguments are passed
+    def("set_piece_hashes", set_piece_hashes_parallel, (arg("ct"), arg("path")
+        , arg("callback") = object(), arg("threads") = 0, arg("read_ahead") = 0
+        , arg("batch_size") = 64, arg("cache") = object()));
     def("set_piece_hashes", set_piece_hashes0);
     def("set_piece_hashes", set_piece_hashes_callback);
 
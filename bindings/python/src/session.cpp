@@ -5,6 +5,11 @@
 #include "boost_python.hpp"
 #include <list>
 #include <string>
+#include <array>
+#include <algorithm>
+#include <memory>
+#include <bitset>
+#include <limits>
 #include <libtorrent/session.hpp>
 #include <libtorrent/session_params.hpp>
 #include <libtorrent/error_code.hpp>
@@ -17,6 +22,7 @@
 #include <libtorrent/torrent_info.hpp>
 #include <libtorrent/kademlia/item.hpp> // for sign_mutable_item
 #include <libtorrent/alert.hpp>
+#include <libtorrent/alert_types.hpp> // for num_alert_types
 #include <libtorrent/time.hpp>
 #include <libtorrent/session_stats.hpp>
 #include <libtorrent/session_status.hpp>
@@ -27,6 +33,19 @@
 #include <libtorrent/extensions/ut_metadata.hpp>
 #include <libtorrent/extensions/ut_pex.hpp>
 
+#include <atomic>
+#include <cerrno>
+#include <cstdio>
+#include <mutex>
+#include <thread>
+
+#ifndef TORRENT_WINDOWS
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
 namespace boost
 {
 	// this fixes mysterious link error on msvc
@@ -40,6 +59,9 @@ namespace boost
 
 #include "gil.hpp"
 #include "bytes.hpp"
+#include "array.hpp"
+#include "buffer.hpp"
+#include "columns.hpp"
 
 #ifdef _MSC_VER
 #pragma warning(push)
@@ -55,6 +77,12 @@ load_torrent_limits dict_to_limits(dict limits);
 
 namespace
 {
+    // incremented every time the bindings change the settings of any session.
+    // Used to tell whether a settings_pack's record of what it applied is
+    // still current. The deprecated setters (e.g. set_download_rate_limit())
+    // don't update it. Only accessed while holding the GIL
+    std::uint64_t settings_generation = 0;
+
 #if TORRENT_ABI_VERSION == 1
     struct dummy {};
 
@@ -70,6 +98,7 @@ namespace
 
     void outgoing_ports(lt::session& s, int _min, int _max)
     {
+        ++settings_generation;
         allow_threading_guard guard;
         settings_pack p;
         p.set_int(settings_pack::outgoing_port, _min);
@@ -114,6 +143,50 @@ namespace
 #endif // TORRENT_DISABLE_EXTENSIONS
     }
 
+	int setting_index(std::string const& key)
+	{
+		int const sett = setting_by_name(key);
+		if (sett < 0)
+		{
+			PyErr_SetString(PyExc_KeyError, ("unknown name in settings_pack: " + key).c_str());
+			throw_error_already_set();
+		}
+		return sett;
+	}
+
+	void set_setting(lt::settings_pack& p, int const sett, object const& value)
+	{
+		switch (sett & settings_pack::type_mask)
+		{
+			case settings_pack::string_type_base:
+				p.set_str(sett, extract<std::string>(value));
+				break;
+			case settings_pack::int_type_base:
+			{
+				std::int64_t const val = extract<std::int64_t>(value);
+				// deliberately truncate and sign-convert here. If we
+				// extract an int directly, unsigned ints may throw
+				// an exception otherwise, if it doesn't fit. Notably for a
+				// flag-type with all bits set.
+				p.set_int(sett, static_cast<int>(val));
+				break;
+			}
+			case settings_pack::bool_type_base:
+				p.set_bool(sett, extract<bool>(value));
+				break;
+		}
+	}
+
+	object get_setting(lt::settings_pack const& p, int const sett)
+	{
+		switch (sett & settings_pack::type_mask)
+		{
+			case settings_pack::string_type_base: return object(p.get_str(sett));
+			case settings_pack::int_type_base: return object(p.get_int(sett));
+			default: return object(p.get_bool(sett));
+		}
+	}
+
 	void make_settings_pack(lt::settings_pack& p, dict const& sett_dict)
 	{
 		stl_input_iterator<std::string> i(sett_dict.keys()), end;
@@ -121,37 +194,13 @@ namespace
 		{
 			std::string const key = *i;
 
-			int sett = setting_by_name(key);
-			if (sett < 0)
-			{
-				PyErr_SetString(PyExc_KeyError, ("unknown name in settings_pack: " + key).c_str());
-				throw_error_already_set();
-			}
+			int const sett = setting_index(key);
 
 			TORRENT_TRY
 			{
 				// if the dictionary doesn't contain "key", it will throw, hence
 				// the try-catch here
-				object const value = sett_dict[key];
-				switch (sett & settings_pack::type_mask)
-				{
-					case settings_pack::string_type_base:
-						p.set_str(sett, extract<std::string>(value));
-						break;
-					case settings_pack::int_type_base:
-					{
-						std::int64_t const val = extract<std::int64_t>(value);
-						// deliberately truncate and sign-convert here. If we
-						// extract an int directly, unsigned ints may throw
-						// an exception otherwise, if it doesn't fit. Notably for a
-						// flag-type with all bits set.
-						p.set_int(sett, static_cast<int>(val));
-						break;
-					}
-					case settings_pack::bool_type_base:
-						p.set_bool(sett, extract<bool>(value));
-						break;
-				}
+				set_setting(p, sett, sett_dict[key]);
 			}
 			TORRENT_CATCH(...) {}
 		}
@@ -184,6 +233,130 @@ namespace
 		return ret;
 	}
 
+	// the python settings_pack. Settings are addressed by their index (see
+	// settings_pack.index()), to avoid looking up names on every call. It
+	// remembers the values it last applied and which session it applied them
+	// to. Applying it to that session again, with no other settings changes
+	// in between, only passes on the settings that changed since
+	struct settings_handle
+	{
+		lt::settings_pack pack;
+		lt::settings_pack applied;
+		std::weak_ptr<lt::aux::session_impl> session;
+		std::uint64_t generation = 0;
+	};
+
+	std::shared_ptr<settings_handle> make_settings_handle(dict const& sett)
+	{
+		auto ret = std::make_shared<settings_handle>();
+		make_settings_pack(ret->pack, sett);
+		return ret;
+	}
+
+	int settings_handle_index(std::string const& name)
+	{
+		return setting_index(name);
+	}
+
+	// settings can be addressed by name or by index
+	int setting_key(object const& key)
+	{
+		extract<int> idx(key);
+		if (!idx.check()) return setting_index(extract<std::string>(key));
+		int const sett = idx();
+		int const type = sett & settings_pack::type_mask;
+		int const i = sett & settings_pack::index_mask;
+		if (sett < 0 || sett > 0xffff
+			|| (type == settings_pack::string_type_base && i >= settings_pack::num_string_settings)
+			|| (type == settings_pack::int_type_base && i >= settings_pack::num_int_settings)
+			|| (type == settings_pack::bool_type_base && i >= settings_pack::num_bool_settings)
+			|| type == settings_pack::type_mask)
+		{
+			PyErr_SetString(PyExc_KeyError, "invalid settings_pack index");
+			throw_error_already_set();
+		}
+		return sett;
+	}
+
+	void check_setting_type(int const sett, int const type)
+	{
+		if ((sett & settings_pack::type_mask) == type) return;
+		PyErr_SetString(PyExc_TypeError, "settings_pack index has the wrong type");
+		throw_error_already_set();
+	}
+
+	void settings_handle_set_int(settings_handle& s, object const& key, std::int64_t const val)
+	{
+		int const sett = setting_key(key);
+		check_setting_type(sett, settings_pack::int_type_base);
+		s.pack.set_int(sett, static_cast<int>(val));
+	}
+
+	void settings_handle_set_bool(settings_handle& s, object const& key, bool const val)
+	{
+		int const sett = setting_key(key);
+		check_setting_type(sett, settings_pack::bool_type_base);
+		s.pack.set_bool(sett, val);
+	}
+
+	void settings_handle_set_str(settings_handle& s, object const& key, std::string val)
+	{
+		int const sett = setting_key(key);
+		check_setting_type(sett, settings_pack::string_type_base);
+		s.pack.set_str(sett, std::move(val));
+	}
+
+	void settings_handle_setitem(settings_handle& s, object const& key, object const& value)
+	{
+		set_setting(s.pack, setting_key(key), value);
+	}
+
+	object settings_handle_getitem(settings_handle const& s, object const& key)
+	{
+		int const sett = setting_key(key);
+		if (!s.pack.has_val(sett))
+		{
+			PyErr_SetObject(PyExc_KeyError, key.ptr());
+			throw_error_already_set();
+		}
+		return get_setting(s.pack, sett);
+	}
+
+	bool settings_handle_contains(settings_handle const& s, object const& key)
+	{
+		return s.pack.has_val(setting_key(key));
+	}
+
+	void settings_handle_update(settings_handle& s, dict const& sett)
+	{
+		make_settings_pack(s.pack, sett);
+	}
+
+	void settings_handle_clear(settings_handle& s)
+	{
+		s.pack.clear();
+		s.applied.clear();
+	}
+
+	dict settings_handle_to_dict(settings_handle const& s)
+	{
+		dict ret;
+		s.pack.for_each([&](std::uint16_t const sett, auto const& val)
+			{ ret[name_for_setting(sett)] = val; });
+		return ret;
+	}
+
+	void set_value(lt::settings_pack& p, int const sett, std::string const& v) { p.set_str(sett, v); }
+	void set_value(lt::settings_pack& p, int const sett, int const v) { p.set_int(sett, v); }
+	void set_value(lt::settings_pack& p, int const sett, bool const v) { p.set_bool(sett, v); }
+
+	bool same_value(lt::settings_pack const& p, int const sett, std::string const& v)
+	{ return p.has_val(sett) && p.get_str(sett) == v; }
+	bool same_value(lt::settings_pack const& p, int const sett, int const v)
+	{ return p.has_val(sett) && p.get_int(sett) == v; }
+	bool same_value(lt::settings_pack const& p, int const sett, bool const v)
+	{ return p.has_val(sett) && p.get_bool(sett) == v; }
+
 	std::shared_ptr<lt::session> make_session(boost::python::dict sett
 		, session_flags_t const flags)
 	{
@@ -214,10 +387,45 @@ namespace
 	{
 		settings_pack p;
 		make_settings_pack(p, sett_dict);
+		++settings_generation;
 		allow_threading_guard guard;
 		ses.apply_settings(p);
 	}
 
+	// only the settings that changed since the pack was last applied are
+	// passed on to the session. If none did, the session isn't called at all.
+	// If the pack was last applied to another session, or the settings were
+	// changed some other way since, the whole pack is applied
+	void session_apply_settings_handle(lt::session& ses, settings_handle& s)
+	{
+		std::shared_ptr<lt::aux::session_impl> const impl = ses.native_handle();
+		bool const same_session = !s.session.owner_before(impl)
+			&& !impl.owner_before(s.session);
+		if (!same_session || s.generation != settings_generation)
+		{
+			s.applied.clear();
+			s.session = impl;
+		}
+
+		settings_pack diff;
+		bool changed = false;
+		s.pack.for_each([&](std::uint16_t const sett, auto const& val)
+		{
+			if (same_value(s.applied, sett, val)) return;
+			set_value(diff, sett, val);
+			changed = true;
+		});
+		if (!changed) return;
+
+		s.generation = ++settings_generation;
+		{
+			allow_threading_guard guard;
+			ses.apply_settings(diff);
+		}
+		diff.for_each([&](std::uint16_t const sett, auto const& val)
+			{ set_value(s.applied, sett, val); });
+	}
+
 	dict session_get_settings(lt::session const& ses)
 	{
 		settings_pack sett;
@@ -228,6 +436,26 @@ namespace
 		return make_dict(sett);
 	}
 
+	// only converts the requested settings to python objects. The keys may be
+	// setting names or indices, and are used as the keys of the returned dict
+	dict session_get_settings_keys(lt::session const& ses, object const& keys)
+	{
+		std::vector<std::pair<object, int>> requested;
+		stl_input_iterator<object> i(keys), end;
+		for (; i != end; ++i)
+			requested.emplace_back(*i, setting_key(*i));
+
+		settings_pack sett;
+		{
+			allow_threading_guard guard;
+			sett = ses.get_settings();
+		}
+		dict ret;
+		for (auto const& r : requested)
+			ret[r.first] = get_setting(sett, r.second);
+		return ret;
+	}
+
 	dict min_memory_usage_wrapper()
 	{
 		settings_pack ret = min_memory_usage();
@@ -260,13 +488,14 @@ namespace
 
     void dict_to_add_torrent_params(dict params, add_torrent_params& p)
     {
-        list items = params.items();
-        int const len = int(boost::python::len(items));
-        for (int i = 0; i < len; i++)
+        // walk the dict in place, rather than building a list of its items
+        PyObject* k;
+        PyObject* v;
+        Py_ssize_t pos = 0;
+        while (PyDict_Next(params.ptr(), &pos, &k, &v))
         {
-            boost::python::api::object_item item = items[i];
-            std::string const key = extract<std::string>(item[0]);
-            object const value = item[1];
+            std::string const key = extract<std::string>(k);
+            object const value{handle<>(borrowed(v))};
             // torrent_info objects are always held by a shared_ptr in the
             // python binding, skip it if it is a object
             if (key == "ti" && value != boost::python::object())
@@ -399,6 +628,113 @@ namespace
         }
     }
 
+std::unique_ptr<column<torrent_status>> make_status_column(std::string const& name)
+{
+#define STATUS_COLUMN(type, field, expr) \
+    if (name == #field) \
+        return make_column<torrent_status, type>([](torrent_status const& st) { return type(expr); });
+#define STATUS_FIELD(type, field) STATUS_COLUMN(type, field, st.field)
+
+    STATUS_COLUMN(std::int32_t, state, static_cast<int>(st.state))
+    STATUS_COLUMN(std::uint64_t, flags, static_cast<std::uint64_t>(st.flags))
+    STATUS_COLUMN(std::int32_t, queue_position, static_cast<int>(st.queue_position))
+    STATUS_FIELD(float, progress)
+    STATUS_FIELD(std::int32_t, progress_ppm)
+    STATUS_FIELD(std::int32_t, download_rate)
+    STATUS_FIELD(std::int32_t, upload_rate)
+    STATUS_FIELD(std::int32_t, download_payload_rate)
+    STATUS_FIELD(std::int32_t, upload_payload_rate)
+    STATUS_FIELD(std::int64_t, total_download)
+    STATUS_FIELD(std::int64_t, total_upload)
+    STATUS_FIELD(std::int64_t, total_payload_download)
+    STATUS_FIELD(std::int64_t, total_payload_upload)
+    STATUS_FIELD(std::int64_t, total_failed_bytes)
+    STATUS_FIELD(std::int64_t, total_redundant_bytes)
+    STATUS_FIELD(std::int64_t, total_done)
+    STATUS_FIELD(std::int64_t, total)
+    STATUS_FIELD(std::int64_t, total_wanted_done)
+    STATUS_FIELD(std::int64_t, total_wanted)
+    STATUS_FIELD(std::int64_t, all_time_upload)
+    STATUS_FIELD(std::int64_t, all_time_download)
+    STATUS_FIELD(std::int64_t, added_time)
+    STATUS_FIELD(std::int64_t, completed_time)
+    STATUS_FIELD(std::int64_t, last_seen_complete)
+    STATUS_COLUMN(std::int64_t, active_duration, total_seconds(st.active_duration))
+    STATUS_COLUMN(std::int64_t, finished_duration, total_seconds(st.finished_duration))
+    STATUS_COLUMN(std::int64_t, seeding_duration, total_seconds(st.seeding_duration))
+    STATUS_FIELD(std::int32_t, num_seeds)
+    STATUS_FIELD(std::int32_t, num_peers)
+    STATUS_FIELD(std::int32_t, num_complete)
+    STATUS_FIELD(std::int32_t, num_incomplete)
+    STATUS_FIELD(std::int32_t, list_seeds)
+    STATUS_FIELD(std::int32_t, list_peers)
+    STATUS_FIELD(std::int32_t, connect_candidates)
+    STATUS_FIELD(std::int32_t, num_pieces)
+    STATUS_FIELD(std::int32_t, distributed_full_copies)
+    STATUS_FIELD(std::int32_t, distributed_fraction)
+    STATUS_FIELD(float, distributed_copies)
+    STATUS_FIELD(std::int32_t, block_size)
+    STATUS_FIELD(std::int32_t, num_uploads)
+    STATUS_FIELD(std::int32_t, num_connections)
+    STATUS_FIELD(std::int32_t, uploads_limit)
+    STATUS_FIELD(std::int32_t, connections_limit)
+    STATUS_FIELD(std::int32_t, up_bandwidth_queue)
+    STATUS_FIELD(std::int32_t, down_bandwidth_queue)
+    STATUS_FIELD(std::int32_t, seed_rank)
+    STATUS_FIELD(std::uint8_t, need_save_resume)
+    STATUS_FIELD(std::uint8_t, is_seeding)
+    STATUS_FIELD(std::uint8_t, is_finished)
+    STATUS_FIELD(std::uint8_t, has_metadata)
+    STATUS_FIELD(std::uint8_t, has_incoming)
+    STATUS_FIELD(std::uint8_t, moving_storage)
+    STATUS_FIELD(std::uint8_t, announcing_to_trackers)
+    STATUS_FIELD(std::uint8_t, announcing_to_lsd)
+    STATUS_FIELD(std::uint8_t, announcing_to_dht)
+
+#undef STATUS_FIELD
+#undef STATUS_COLUMN
+
+    PyErr_SetString(PyExc_KeyError, ("unknown torrent_status field: " + name).c_str());
+    throw_error_already_set();
+    return {};
+}
+
+dict status_table(std::vector<torrent_status> const& torrents, object const& fields)
+{
+    std::vector<std::string> names;
+    std::vector<std::unique_ptr<column<torrent_status>>> columns;
+    bool include_handles = false;
+    stl_input_iterator<std::string> i(fields), end;
+    for (; i != end; ++i)
+    {
+        std::string const name = *i;
+        if (name == "handle")
+        {
+            include_handles = true;
+            continue;
+        }
+        columns.push_back(make_status_column(name));
+        names.push_back(name);
+    }
+
+    {
+        allow_threading_guard guard;
+        for (auto& c : columns) c->fill(torrents);
+    }
+
+    dict ret;
+    for (std::size_t k = 0; k < columns.size(); ++k)
+        ret[names[k]] = columns[k]->to_python();
+
+    if (include_handles)
+    {
+        list handles;
+        for (torrent_status const& st : torrents) handles.append(st.handle);
+        ret["handle"] = handles;
+    }
+    return ret;
+}
+
 namespace
 {
 
@@ -454,6 +790,221 @@ namespace
         s.async_add_torrent(std::move(p));
     }
 
+    // converts a whole batch of torrents to add, and posts them to the session
+    // without holding the GIL. The elements may be dicts, add_torrent_params
+    // objects or bencoded resume data (any object supporting the buffer
+    // protocol). The resume data is decoded without the GIL too. If any of it
+    // fails to decode, none of the torrents are added.
+    // The session has no call to add several torrents at once, so each one is
+    // still posted to the network thread separately
+    void async_add_torrents(lt::session& s, object const& params)
+    {
+        std::vector<add_torrent_params> atps;
+        std::vector<std::pair<std::size_t, buffer_view>> resume;
+        stl_input_iterator<object> i(params), end;
+        for (; i != end; ++i)
+        {
+            object const o = *i;
+            if (PyDict_Check(o.ptr()))
+            {
+                atps.emplace_back();
+                dict_to_add_torrent_params(dict(o), atps.back());
+            }
+            else if (PyObject_CheckBuffer(o.ptr()))
+            {
+                resume.emplace_back(atps.size(), buffer_view(o.ptr()));
+                atps.emplace_back();
+            }
+            else
+            {
+                add_torrent_params const& p = extract<add_torrent_params const&>(o);
+                atps.push_back(p);
+                // don't share the python-owned torrent_info with libtorrent
+                if (p.ti) atps.back().ti = std::make_shared<torrent_info>(*p.ti);
+            }
+        }
+
+        allow_threading_guard guard;
+        error_code ec;
+        for (auto const& r : resume)
+        {
+            atps[r.first] = read_resume_data({r.second.data()
+                , std::ptrdiff_t(r.second.size())}, ec);
+#ifndef BOOST_NO_EXCEPTIONS
+            if (ec) throw system_error(ec);
+#else
+            if (ec) return;
+#endif
+        }
+        for (auto& p : atps)
+            s.async_add_torrent(std::move(p));
+    }
+
+    // the contents of a file, either read into memory or memory mapped
+    struct file_contents
+    {
+        file_contents() = default;
+        file_contents(file_contents const&) = delete;
+        file_contents& operator=(file_contents const&) = delete;
+        ~file_contents()
+        {
+#ifndef TORRENT_WINDOWS
+            if (mapped != nullptr) ::munmap(mapped, size);
+#endif
+        }
+
+        span<char const> data() const
+        {
+            if (mapped != nullptr)
+                return {static_cast<char const*>(mapped), std::ptrdiff_t(size)};
+            return buf;
+        }
+
+        std::vector<char> buf;
+        void* mapped = nullptr;
+        std::size_t size = 0;
+    };
+
+    error_code read_file(std::string const& path, bool const use_mmap
+        , file_contents& f)
+    {
+#ifndef TORRENT_WINDOWS
+        // check the type before opening, opening a fifo would block, and
+        // reading a directory fails differently with mmap and read()
+        struct ::stat st;
+        if (::stat(path.c_str(), &st) != 0)
+            return error_code(errno, system_category());
+        if (!S_ISREG(st.st_mode))
+            return error_code(S_ISDIR(st.st_mode) ? EISDIR : EINVAL, system_category());
+
+        int const fd = ::open(path.c_str(), O_RDONLY);
+        if (fd < 0) return error_code(errno, system_category());
+        error_code ec;
+        if (use_mmap)
+        {
+            if (::fstat(fd, &st) != 0)
+            {
+                ec.assign(errno, system_category());
+            }
+            else if (st.st_size > 0)
+            {
+                void* const p = ::mmap(nullptr, std::size_t(st.st_size)
+                    , PROT_READ, MAP_PRIVATE, fd, 0);
+                if (p == MAP_FAILED)
+                {
+                    ec.assign(errno, system_category());
+                }
+                else
+                {
+                    f.mapped = p;
+                    f.size = std::size_t(st.st_size);
+                }
+            }
+        }
+        else
+        {
+            char tmp[64 * 1024];
+            for (;;)
+            {
+                ssize_t const n = ::read(fd, tmp, sizeof(tmp));
+                if (n < 0 && errno == EINTR) continue;
+                if (n < 0) ec.assign(errno, system_category());
+                if (n <= 0) break;
+                f.buf.insert(f.buf.end(), tmp, tmp + n);
+            }
+        }
+        ::close(fd);
+        return ec;
+#else
+        static_cast<void>(use_mmap);
+        // errno is set by the CRT here, not by the system
+        std::FILE* file = std::fopen(path.c_str(), "rb");
+        if (file == nullptr) return error_code(errno, generic_category());
+        char tmp[64 * 1024];
+        std::size_t n;
+        while ((n = std::fread(tmp, 1, sizeof(tmp), file)) > 0)
+            f.buf.insert(f.buf.end(), tmp, tmp + n);
+        error_code ec;
+        if (std::ferror(file) != 0) ec.assign(errno, generic_category());
+        std::fclose(file);
+        return ec;
+#endif
+    }
+
+    // reads and decodes all the .fastresume files in directory on a pool of
+    // threads, without holding the GIL. Each thread adds the torrents it has
+    // decoded to the session every batch_size torrents. Returns a list of
+    // (path, error) of the files that failed to load
+    list session_load_resume_data(lt::session& ses, std::string const& directory
+        , int const threads, int const batch_size, bool const use_mmap)
+    {
+        std::string const ext = ".fastresume";
+        std::vector<std::string> paths;
+        object const join = import("os").attr("path").attr("join");
+        stl_input_iterator<std::string> i(import("os").attr("listdir")(directory)), end;
+        for (; i != end; ++i)
+        {
+            std::string const name = *i;
+            if (name.size() <= ext.size()
+                || name.compare(name.size() - ext.size(), ext.size(), ext) != 0)
+                continue;
+            paths.push_back(extract<std::string>(join(directory, name)));
+        }
+        std::sort(paths.begin(), paths.end());
+
+        std::vector<std::pair<std::string, error_code>> failed;
+        {
+            allow_threading_guard guard;
+            std::atomic<std::size_t> next{0};
+            std::mutex mutex;
+            std::size_t const batch = std::size_t(std::max(1, batch_size));
+            auto worker = [&]
+            {
+                std::vector<add_torrent_params> added;
+                for (;;)
+                {
+                    std::size_t const idx = next++;
+                    if (idx >= paths.size()) break;
+
+                    file_contents f;
+                    error_code ec = read_file(paths[idx], use_mmap, f);
+                    if (!ec)
+                    {
+                        add_torrent_params atp = read_resume_data(f.data(), ec);
+                        if (!ec) added.push_back(std::move(atp));
+                    }
+                    if (ec)
+                    {
+                        std::lock_guard<std::mutex> l(mutex);
+                        failed.emplace_back(paths[idx], ec);
+                        continue;
+                    }
+
+                    if (added.size() < batch) continue;
+                    for (auto& p : added) ses.async_add_torrent(std::move(p));
+                    added.clear();
+                }
+                for (auto& p : added) ses.async_add_torrent(std::move(p));
+            };
+
+            std::size_t const num_threads = std::min(paths.size(), std::size_t(
+                threads > 0 ? threads : std::max(1, int(std::thread::hardware_concurrency()))));
+            std::vector<std::thread> pool;
+            for (std::size_t k = 1; k < num_threads; ++k) pool.emplace_back(worker);
+            worker();
+            for (auto& t : pool) t.join();
+        }
+
+        std::sort(failed.begin(), failed.end()
+            , [](std::pair<std::string, error_code> const& lhs
+                , std::pair<std::string, error_code> const& rhs)
+            { return lhs.first < rhs.first; });
+        list ret;
+        for (auto const& f : failed)
+            ret.append(boost::python::make_tuple(f.first, f.second));
+        return ret;
+    }
+
 #if TORRENT_ABI_VERSION == 1
     void start_natpmp(lt::session& s)
     {
@@ -504,6 +1055,11 @@ namespace
 
     void set_alert_fd(lt::session& s, std::intptr_t const fd)
     {
+        if (fd == -1)
+        {
+            s.set_alert_notify(std::function<void()>());
+            return;
+        }
 #ifdef TORRENT_WINDOWS
         auto const sock = static_cast<SOCKET>(fd);
         int res;
@@ -567,6 +1123,123 @@ namespace
         return ret;
     }
 
+    // a predicate for get_torrent_status() that is evaluated entirely in the
+    // network thread, without calling back into python for every torrent
+    struct status_filter
+    {
+        // bit i is set if torrent_status::state_t i matches
+        std::bitset<8> states = std::bitset<8>().set();
+
+        // (flags & flags_mask) must equal flags
+        torrent_flags_t flags{};
+        torrent_flags_t flags_mask{};
+
+        int min_download_rate = 0;
+        int max_download_rate = std::numeric_limits<int>::max();
+        int min_upload_rate = 0;
+        int max_upload_rate = std::numeric_limits<int>::max();
+        int min_progress_ppm = 0;
+        int max_progress_ppm = 1000000;
+
+        bool operator()(torrent_status const& st) const
+        {
+            return states[std::size_t(st.state)]
+                && (st.flags & flags_mask) == flags
+                && st.download_payload_rate >= min_download_rate
+                && st.download_payload_rate <= max_download_rate
+                && st.upload_payload_rate >= min_upload_rate
+                && st.upload_payload_rate <= max_upload_rate
+                && st.progress_ppm >= min_progress_ppm
+                && st.progress_ppm <= max_progress_ppm;
+        }
+    };
+
+    status_filter dict_to_status_filter(dict const& d)
+    {
+        status_filter ret;
+        bool has_mask = false;
+        stl_input_iterator<std::string> i(d.keys()), end;
+        for (; i != end; ++i)
+        {
+            std::string const key = *i;
+
+            object const value = d[key];
+            if (key == "states")
+            {
+                ret.states.reset();
+                stl_input_iterator<int> s(value), s_end;
+                for (; s != s_end; ++s)
+                {
+                    int const state = *s;
+                    if (state < 0 || state >= int(ret.states.size()))
+                    {
+                        PyErr_SetString(PyExc_ValueError, "invalid torrent state in status filter");
+                        throw_error_already_set();
+                    }
+                    ret.states.set(std::size_t(state));
+                }
+            }
+            else if (key == "flags")
+            {
+                ret.flags = extract<torrent_flags_t>(value);
+            }
+            else if (key == "flags_mask")
+            {
+                ret.flags_mask = extract<torrent_flags_t>(value);
+                has_mask = true;
+            }
+            else if (key == "min_download_rate")
+            {
+                ret.min_download_rate = extract<int>(value);
+            }
+            else if (key == "max_download_rate")
+            {
+                ret.max_download_rate = extract<int>(value);
+            }
+            else if (key == "min_upload_rate")
+            {
+                ret.min_upload_rate = extract<int>(value);
+            }
+            else if (key == "max_upload_rate")
+            {
+                ret.max_upload_rate = extract<int>(value);
+            }
+            else if (key == "min_progress_ppm")
+            {
+                ret.min_progress_ppm = extract<int>(value);
+            }
+            else if (key == "max_progress_ppm")
+            {
+                ret.max_progress_ppm = extract<int>(value);
+            }
+            else
+            {
+                PyErr_SetString(PyExc_KeyError, ("unknown name in status filter: " + key).c_str());
+                throw_error_already_set();
+            }
+        }
+        // without an explicit mask, all the specified flags are required to
+        // be set
+        if (!has_mask) ret.flags_mask = ret.flags;
+        ret.flags &= ret.flags_mask;
+        return ret;
+    }
+
+    list get_torrent_status_filtered(lt::session& s, dict const& filter, int const flags)
+    {
+        status_filter const f = dict_to_status_filter(filter);
+        std::vector<torrent_status> torrents;
+        {
+            allow_threading_guard guard;
+            torrents = s.get_torrent_status(std::cref(f), status_flags_t(flags));
+        }
+
+        list ret;
+        for (torrent_status const& st : torrents)
+            ret.append(st);
+        return ret;
+    }
+
     list refresh_torrent_status(lt::session& s, list in_torrents, int const flags)
     {
         std::vector<torrent_status> torrents;
@@ -585,6 +1258,24 @@ namespace
         return ret;
     }
 
+    // returns a dict mapping each of the requested torrent_status fields to
+    // an array.array with one element per torrent. The special field
+    // "handle" is a list of the torrent_handles, in the same order. If a
+    // filter dict is passed, only torrents matching it are included (see
+    // dict_to_status_filter())
+    dict torrent_status_table(lt::session& s, object const& fields, int const flags
+        , object const& filter)
+    {
+        status_filter const f = filter.is_none()
+            ? status_filter() : dict_to_status_filter(extract<dict>(filter));
+        std::vector<torrent_status> torrents;
+        {
+            allow_threading_guard guard;
+            torrents = s.get_torrent_status(std::cref(f), status_flags_t(flags));
+        }
+        return status_table(torrents, fields);
+    }
+
 #if TORRENT_ABI_VERSION == 1
     dict get_utp_stats(session_status const& st)
     {
@@ -625,9 +1316,93 @@ namespace
         return ret;
     }
 
+    // returns true if the python class bound to the alert's dynamic type is
+    // one of, or derives from one of, the classes in ``types``
+    bool alert_type_matches(alert const* a, std::vector<PyTypeObject*> const& types)
+    {
+        converter::registration const* r
+            = converter::registry::query(type_info(typeid(*a)));
+        if (r == nullptr || r->m_class_object == nullptr) return false;
+        for (PyTypeObject* t : types)
+        {
+            if (PyType_IsSubtype(r->m_class_object, t)) return true;
+        }
+        return false;
+    }
+
+    // like pop_alerts(), but reuses the slots of the list passed in instead of
+    // allocating a new one, and only wraps alerts whose type is one of
+    // ``types`` (or derived from one). Alerts of other types are dropped
+    // without ever creating a python object for them.
+    int pop_alerts_into(lt::session& ses, list buffer, object const& types)
+    {
+        std::vector<PyTypeObject*> type_filter;
+        if (!types.is_none())
+        {
+            stl_input_iterator<object> i(types), end;
+            for (; i != end; ++i)
+            {
+                object const t = *i;
+                if (!PyType_Check(t.ptr()))
+                {
+                    PyErr_SetString(PyExc_TypeError, "types must be alert classes");
+                    throw_error_already_set();
+                }
+                type_filter.push_back(reinterpret_cast<PyTypeObject*>(t.ptr()));
+            }
+        }
+
+        std::vector<alert*> alerts;
+        {
+            allow_threading_guard guard;
+            ses.pop_alerts(&alerts);
+        }
+
+        if (!types.is_none())
+        {
+            // alerts of the same type are typically bunched together, so
+            // remember the verdict for each alert type we've seen. Plugin
+            // alerts have types from user_alert_id and up, they're not cached
+            std::array<std::int8_t, num_alert_types> matches;
+            matches.fill(-1);
+            alerts.erase(std::remove_if(alerts.begin(), alerts.end()
+                , [&](alert const* a)
+                {
+                    int const type = a->type();
+                    if (type < 0 || type >= num_alert_types)
+                        return !alert_type_matches(a, type_filter);
+                    std::int8_t& m = matches[std::size_t(type)];
+                    if (m < 0) m = alert_type_matches(a, type_filter) ? 1 : 0;
+                    return m == 0;
+                }), alerts.end());
+        }
+
+        Py_ssize_t const old_size = PyList_GET_SIZE(buffer.ptr());
+        Py_ssize_t const new_size = Py_ssize_t(alerts.size());
+        for (Py_ssize_t i = 0; i < new_size; ++i)
+        {
+            object a(boost::python::ptr(alerts[std::size_t(i)]));
+            if (i < old_size)
+            {
+                // PyList_SetItem steals the reference
+                PyList_SetItem(buffer.ptr(), i, incref(a.ptr()));
+            }
+            else
+            {
+                buffer.append(a);
+            }
+        }
+        if (new_size < old_size
+            && PyList_SetSlice(buffer.ptr(), new_size, old_size, nullptr) < 0)
+            throw_error_already_set();
+
+        return int(new_size);
+    }
+
 	void load_state(lt::session& ses, entry const& st, std::uint32_t const flags)
 	{
 #if TORRENT_ABI_VERSION <= 2
+		++settings_generation;
 		allow_threading_guard guard;
 
 		std::vector<char> buf;
@@ -764,6 +1539,25 @@ namespace
 		 return lt::find_metric_idx(name);
 	 }
 
+	// returns a list of all metric names, where the name of the metric at
+	// value_index i is at index i. This is the column layout of
+	// session_stats_alert.counters_view
+	list session_stats_metric_names()
+	{
+		static std::vector<std::string> const names = []
+		{
+			std::vector<stats_metric> const metrics = session_stats_metrics();
+			std::vector<std::string> ret(metrics.size());
+			for (stats_metric const& m : metrics)
+				ret[std::size_t(m.value_index)] = m.name;
+			return ret;
+		}();
+
+		list ret;
+		for (std::string const& n : names) ret.append(n);
+		return ret;
+	}
+
 	bytes write_resume_data_buf_(add_torrent_params const& atp)
 	{
 		bytes ret;
@@ -800,10 +1594,17 @@ namespace
         return make_dict(sp.settings);
     }
 
-    void set_settings(session_params& sp, dict d)
+    // accepts a dict or a settings_pack
+    void set_settings(session_params& sp, object const& o)
     {
+        extract<settings_handle const&> handle(o);
+        if (handle.check())
+        {
+            sp.settings = handle().pack;
+            return;
+        }
         settings_pack p;
-        make_settings_pack(p, d);
+        make_settings_pack(p, extract<dict>(o));
         sp.settings = p;
     }
 
@@ -953,6 +1754,21 @@ void bind_session()
 #endif
       ;
 
+    class_<settings_handle, std::shared_ptr<settings_handle>>("settings_pack")
+        .def("__init__", make_constructor(&make_settings_handle))
+        .def("index", &settings_handle_index, (arg("name")))
+        .staticmethod("index")
+        .def("set_int", &settings_handle_set_int, (arg("key"), arg("value")))
+        .def("set_bool", &settings_handle_set_bool, (arg("key"), arg("value")))
+        .def("set_str", &settings_handle_set_str, (arg("key"), arg("value")))
+        .def("__setitem__", &settings_handle_setitem)
+        .def("__getitem__", &settings_handle_getitem)
+        .def("__contains__", &settings_handle_contains)
+        .def("update", &settings_handle_update)
+        .def("clear", &settings_handle_clear)
+        .def("to_dict", &settings_handle_to_dict)
+        ;
+
     class_<session_params>("session_params")
         .def(init<settings_pack const&>())
         .def(init<>())
@@ -1124,6 +1940,9 @@ void bind_session()
         .def("add_torrent", &add_torrent)
         .def("async_add_torrent", &async_add_torrent)
         .def("async_add_torrent", &wrap_async_add_torrent)
+        .def("async_add_torrents", &async_add_torrents, (arg("params")))
+        .def("load_resume_data", &session_load_resume_data, (arg("directory")
+            , arg("threads") = 0, arg("batch_size") = 256, arg("mmap") = false))
         .def("add_torrent", &wrap_add_torrent)
 #ifndef BOOST_NO_EXCEPTIONS
 #if TORRENT_ABI_VERSION == 1
@@ -1142,7 +1961,9 @@ void bind_session()
         .def("status", depr(&lt::session::status))
 #endif
         .def("get_settings", &session_get_settings)
+        .def("get_settings", &session_get_settings_keys, (arg("keys")))
         .def("apply_settings", &session_apply_settings)
+        .def("apply_settings", &session_apply_settings_handle)
 #if TORRENT_ABI_VERSION == 1
 #ifndef TORRENT_DISABLE_ENCRYPTION
         .def("set_pe_settings", depr(&lt::session::set_pe_settings))
@@ -1152,6 +1973,7 @@ void bind_session()
         .def("load_state", &load_state, (arg("entry"), arg("flags") = 0xffffffff))
         .def("save_state", &save_state, (arg("entry"), arg("flags") = 0xffffffff))
         .def("pop_alerts", &pop_alerts)
+        .def("pop_alerts_into", &pop_alerts_into, (arg("buffer"), arg("types") = object()))
         .def("wait_for_alert", &wait_for_alert, return_internal_reference<>())
         .def("set_alert_notify", &set_alert_notify)
         .def("set_alert_fd", &set_alert_fd)
@@ -1167,7 +1989,9 @@ void bind_session()
         .def("find_torrent", allow_threads(&lt::session::find_torrent))
         .def("get_torrents", &get_torrents)
         .def("get_torrent_status", &get_torrent_status, (arg("session"), arg("pred"), arg("flags") = 0))
+        .def("get_torrent_status", &get_torrent_status_filtered, (arg("session"), arg("filter"), arg("flags") = 0))
         .def("refresh_torrent_status", &refresh_torrent_status, (arg("session"), arg("torrents"), arg("flags") = 0))
+        .def("torrent_status_table", &torrent_status_table, (arg("fields"), arg("flags") = 0, arg("filter") = object()))
         .def("pause", allow_threads(&lt::session::pause))
         .def("resume", allow_threads(&lt::session::resume))
         .def("is_paused", allow_threads(&lt::session::is_paused))
@@ -1296,6 +2120,7 @@ void bind_session()
 
     def("session_stats_metrics", session_stats_metrics);
     def("find_metric_idx", find_metric_idx_wrap);
+    def("session_stats_metric_names", session_stats_metric_names);
 
     scope().attr("create_ut_metadata_plugin") = "ut_metadata";
     scope().attr("create_ut_pex_plugin") = "ut_pex";
@@ -5,7 +5,13 @@
 #include "boost_python.hpp"
 #include <boost/python/tuple.hpp>
 #include <boost/python/stl_iterator.hpp>
+#include <algorithm>
+#include <cstring>
+#include <map>
 #include "bytes.hpp"
+#include "buffer.hpp"
+#include "array.hpp"
+#include "columns.hpp"
 #include <libtorrent/torrent_handle.hpp>
 #include <libtorrent/torrent_info.hpp>
 #include <libtorrent/torrent_status.hpp>
@@ -85,6 +91,31 @@ namespace
       return ret;
   }
 
+  object piece_availability_array(torrent_handle& handle)
+  {
+      std::vector<int> avail;
+      {
+          allow_threading_guard guard;
+          handle.piece_availability(avail);
+      }
+      return make_array(reinterpret_cast<std::int32_t const*>(avail.data())
+          , avail.size());
+  }
+
+  static_assert(sizeof(download_priority_t) == 1
+      , "piece_priorities_array() assumes priorities are one byte");
+
+  object piece_priorities_array(torrent_handle& handle)
+  {
+      std::vector<download_priority_t> prio;
+      {
+          allow_threading_guard guard;
+          prio = handle.get_piece_priorities();
+      }
+      return make_array(reinterpret_cast<std::uint8_t const*>(prio.data())
+          , prio.size());
+  }
+
 } // namespace unnamed
 
 list file_progress(torrent_handle& handle, file_progress_flags_t const flags)
@@ -109,6 +140,16 @@ list file_progress(torrent_handle& handle, file_progress_flags_t const flags)
     return result;
 }
 
+object file_progress_array(torrent_handle& handle, file_progress_flags_t const flags)
+{
+    std::vector<std::int64_t> p;
+    {
+        allow_threading_guard guard;
+        handle.file_progress(p, flags);
+    }
+    return make_array(p);
+}
+
 list get_peer_info(torrent_handle const& handle)
 {
     std::vector<peer_info> pi;
@@ -126,6 +167,150 @@ list get_peer_info(torrent_handle const& handle)
     return result;
 }
 
+namespace
+{
+    using peer_column = column<peer_info>;
+
+    std::unique_ptr<peer_column> make_peer_column(std::string const& name)
+    {
+#define PEER_COLUMN(type, field, expr) \
+        if (name == #field) \
+            return make_column<peer_info, type>([](peer_info const& pi) { return type(expr); });
+#define PEER_FIELD(type, field) PEER_COLUMN(type, field, pi.field)
+
+        PEER_COLUMN(std::uint32_t, flags, static_cast<std::uint32_t>(pi.flags))
+        PEER_COLUMN(std::uint8_t, source, static_cast<std::uint8_t>(pi.source))
+        PEER_COLUMN(std::uint8_t, read_state, static_cast<std::uint8_t>(pi.read_state))
+        PEER_COLUMN(std::uint8_t, write_state, static_cast<std::uint8_t>(pi.write_state))
+        PEER_COLUMN(std::uint8_t, connection_type, static_cast<std::uint8_t>(pi.connection_type))
+        PEER_FIELD(std::int32_t, up_speed)
+        PEER_FIELD(std::int32_t, down_speed)
+        PEER_FIELD(std::int32_t, payload_up_speed)
+        PEER_FIELD(std::int32_t, payload_down_speed)
+        PEER_FIELD(std::int64_t, total_download)
+        PEER_FIELD(std::int64_t, total_upload)
+        PEER_COLUMN(std::int64_t, last_request, total_seconds(pi.last_request))
+        PEER_COLUMN(std::int64_t, last_active, total_seconds(pi.last_active))
+        PEER_COLUMN(std::int64_t, download_queue_time, total_seconds(pi.download_queue_time))
+        PEER_FIELD(std::int32_t, queue_bytes)
+        PEER_FIELD(std::int32_t, request_timeout)
+        PEER_FIELD(std::int32_t, send_buffer_size)
+        PEER_FIELD(std::int32_t, used_send_buffer)
+        PEER_FIELD(std::int32_t, receive_buffer_size)
+        PEER_FIELD(std::int32_t, used_receive_buffer)
+        PEER_FIELD(std::int32_t, num_hashfails)
+        PEER_FIELD(std::int32_t, download_queue_length)
+        PEER_FIELD(std::int32_t, upload_queue_length)
+        PEER_FIELD(std::int32_t, failcount)
+        PEER_COLUMN(std::int32_t, downloading_piece_index, static_cast<int>(pi.downloading_piece_index))
+        PEER_FIELD(std::int32_t, downloading_block_index)
+        PEER_FIELD(std::int32_t, downloading_progress)
+        PEER_FIELD(std::int32_t, downloading_total)
+        PEER_FIELD(std::int32_t, pending_disk_bytes)
+        PEER_FIELD(std::int32_t, send_quota)
+        PEER_FIELD(std::int32_t, receive_quota)
+        PEER_FIELD(std::int32_t, rtt)
+        PEER_FIELD(std::int32_t, num_pieces)
+        PEER_FIELD(std::int32_t, download_rate_peak)
+        PEER_FIELD(std::int32_t, upload_rate_peak)
+        PEER_FIELD(float, progress)
+        PEER_FIELD(std::int32_t, progress_ppm)
+
+#undef PEER_FIELD
+#undef PEER_COLUMN
+
+        PyErr_SetString(PyExc_KeyError, ("unknown peer_info field: " + name).c_str());
+        throw_error_already_set();
+        return {};
+    }
+
+    tuple endpoint_tuple(tcp::endpoint const& ep)
+    {
+        return boost::python::make_tuple(ep.address().to_string(), ep.port());
+    }
+}
+
+// returns a dict mapping each of the requested peer_info fields to an
+// array.array with one element per peer. A few fields that aren't numbers are
+// returned as lists instead ("ip", "local_endpoint", "pid" and "client").
+// "pieces" is a single bytes object with one row per peer, each holding the
+// peer's bitfield packed 8 pieces per byte (with the first piece in the most
+// significant bit), padded to (num_pieces + 7) / 8 bytes
+dict peer_table(torrent_handle const& th, object const& fields)
+{
+    std::vector<std::string> names;
+    std::vector<std::unique_ptr<peer_column>> columns;
+    std::vector<std::string> list_fields;
+    bool include_pieces = false;
+    stl_input_iterator<std::string> i(fields), end;
+    for (; i != end; ++i)
+    {
+        std::string const name = *i;
+        if (name == "ip" || name == "local_endpoint" || name == "pid" || name == "client")
+        {
+            list_fields.push_back(name);
+            continue;
+        }
+        if (name == "pieces")
+        {
+            include_pieces = true;
+            continue;
+        }
+        columns.push_back(make_peer_column(name));
+        names.push_back(name);
+    }
+
+    std::vector<peer_info> peers;
+    std::string pieces;
+    {
+        allow_threading_guard guard;
+        th.get_peer_info(peers);
+        for (auto& c : columns) c->fill(peers);
+
+        if (include_pieces)
+        {
+            int num_pieces = 0;
+            std::shared_ptr<torrent_info const> const ti = th.torrent_file();
+            if (ti && ti->is_valid()) num_pieces = ti->num_pieces();
+            for (peer_info const& pi : peers)
+                num_pieces = std::max(num_pieces, pi.pieces.size());
+
+            std::size_t const stride = std::size_t(num_pieces + 7) / 8;
+            pieces.resize(stride * peers.size(), '\0');
+            for (std::size_t k = 0; k < peers.size(); ++k)
+            {
+                auto const& bits = peers[k].pieces;
+                if (bits.empty()) continue;
+                std::memcpy(&pieces[k * stride], bits.data()
+                    , std::size_t(bits.size() + 7) / 8);
+            }
+        }
+    }
+
+    dict ret;
+    for (std::size_t k = 0; k < columns.size(); ++k)
+        ret[names[k]] = columns[k]->to_python();
+
+    for (std::string const& name : list_fields)
+    {
+        list values;
+        for (peer_info const& pi : peers)
+        {
+            if (name == "ip") values.append(endpoint_tuple(pi.ip));
+            else if (name == "local_endpoint") values.append(endpoint_tuple(pi.local_endpoint));
+            else if (name == "pid") values.append(pi.pid);
+            else values.append(bytes(pi.client));
+        }
+        ret[name] = values;
+    }
+
+    if (include_pieces)
+        ret["pieces"] = object(handle<>(PyBytes_FromStringAndSize(pieces.data()
+            , Py_ssize_t(pieces.size()))));
+
+    return ret;
+}
+
 namespace
 {
    template <typename T>
@@ -137,6 +322,36 @@ namespace
 
 void prioritize_pieces(torrent_handle& info, object o)
 {
+   // a buffer of integers (e.g. array.array or a numpy array) is a vector of
+   // priorities, one per piece
+   if (PyObject_CheckBuffer(o.ptr()))
+   {
+      buffer_view const buf(o.ptr(), PyBUF_FORMAT | PyBUF_C_CONTIGUOUS);
+      std::vector<download_priority_t> priority_vector;
+      priority_vector.reserve(buf.itemsize() == 0 ? 0 : buf.size() / buf.itemsize());
+      bool in_range = true;
+      bool const valid = for_each_integer(buf, [&](std::int64_t const p)
+      {
+         if (p < static_cast<std::uint8_t>(dont_download)
+            || p > static_cast<std::uint8_t>(top_priority))
+            in_range = false;
+         priority_vector.push_back(download_priority_t(std::uint8_t(p)));
+      });
+      if (!valid)
+      {
+         PyErr_SetString(PyExc_TypeError, "piece priority buffer must hold integers");
+         throw_error_already_set();
+      }
+      if (!in_range)
+      {
+         PyErr_SetString(PyExc_ValueError, "piece priority out of range");
+         throw_error_already_set();
+      }
+      allow_threading_guard guard;
+      info.prioritize_pieces(priority_vector);
+      return;
+   }
+
    stl_input_iterator<object> begin(o), end;
    if (begin == end) return;
 
@@ -402,6 +617,133 @@ list get_download_queue(torrent_handle& handle)
     return ret;
 }
 
+// the download queue of a torrent, with one entry per block rather than a
+// dict per block. The per-block arrays are indexed by first_block[piece] +
+// block. peer is an index into the peers table, or -1
+struct packed_download_queue
+{
+    std::vector<std::int32_t> piece_index;
+    std::vector<std::int32_t> blocks_in_piece;
+    std::vector<std::int32_t> first_block;
+    std::vector<std::uint8_t> state;
+    std::vector<std::uint16_t> num_peers;
+    std::vector<std::uint16_t> bytes_progress;
+    std::vector<std::uint16_t> block_size;
+    std::vector<std::int32_t> peer;
+    std::vector<tcp::endpoint> peers;
+};
+
+// python's view of a packed_download_queue. The arrays are exposed as
+// memoryviews sharing the packed_download_queue. It's also a sequence of the
+// same dicts as get_download_queue() returns, which are built on access
+struct download_queue_view
+{
+    std::shared_ptr<packed_download_queue> q;
+
+    int len() const { return int(q->piece_index.size()); }
+
+    dict getitem(int i) const
+    {
+        if (i < 0) i += len();
+        if (i < 0 || i >= len())
+        {
+            PyErr_SetString(PyExc_IndexError, "download_queue index out of range");
+            throw_error_already_set();
+        }
+
+        dict partial_piece;
+        partial_piece["piece_index"] = q->piece_index[std::size_t(i)];
+        partial_piece["blocks_in_piece"] = q->blocks_in_piece[std::size_t(i)];
+        list block_list;
+        int const first = q->first_block[std::size_t(i)];
+        for (int k = first; k < first + q->blocks_in_piece[std::size_t(i)]; ++k)
+        {
+            std::size_t const b = std::size_t(k);
+            dict block_info;
+            block_info["state"] = q->state[b];
+            block_info["num_peers"] = q->num_peers[b];
+            block_info["bytes_progress"] = q->bytes_progress[b];
+            block_info["block_size"] = q->block_size[b];
+            tcp::endpoint const ep = q->peer[b] < 0 ? tcp::endpoint()
+                : q->peers[std::size_t(q->peer[b])];
+            block_info["peer"] = boost::python::make_tuple(
+                ep.address().to_string(), ep.port());
+            block_list.append(block_info);
+        }
+        partial_piece["blocks"] = block_list;
+        return partial_piece;
+    }
+
+    list get_peers() const
+    {
+        list ret;
+        for (auto const& ep : q->peers)
+            ret.append(boost::python::make_tuple(ep.address().to_string(), ep.port()));
+        return ret;
+    }
+};
+
+template <std::vector<std::int32_t> packed_download_queue::*Field>
+object download_queue_int32(download_queue_view const& v)
+{ return make_memoryview(v.q, (*v.q).*Field); }
+
+template <std::vector<std::uint16_t> packed_download_queue::*Field>
+object download_queue_uint16(download_queue_view const& v)
+{ return make_memoryview(v.q, (*v.q).*Field); }
+
+object download_queue_state(download_queue_view const& v)
+{ return make_memoryview(v.q, v.q->state); }
+
+download_queue_view get_download_queue_packed(torrent_handle& handle)
+{
+    std::vector<partial_piece_info> downloading;
+    auto q = std::make_shared<packed_download_queue>();
+    {
+        allow_threading_guard guard;
+        downloading = handle.get_download_queue();
+
+        std::size_t num_blocks = 0;
+        for (auto const& pp : downloading) num_blocks += std::size_t(pp.blocks_in_piece);
+        q->piece_index.reserve(downloading.size());
+        q->blocks_in_piece.reserve(downloading.size());
+        q->first_block.reserve(downloading.size());
+        q->state.reserve(num_blocks);
+        q->num_peers.reserve(num_blocks);
+        q->bytes_progress.reserve(num_blocks);
+        q->block_size.reserve(num_blocks);
+        q->peer.reserve(num_blocks);
+
+        // the same few peers tend to be downloading most blocks, so only
+        // store each endpoint once
+        std::map<tcp::endpoint, std::int32_t> peer_index;
+        for (auto const& pp : downloading)
+        {
+            q->piece_index.push_back(static_cast<int>(pp.piece_index));
+            q->blocks_in_piece.push_back(pp.blocks_in_piece);
+            q->first_block.push_back(std::int32_t(q->state.size()));
+            for (int k = 0; k < pp.blocks_in_piece; ++k)
+            {
+                block_info const& b = pp.blocks[k];
+                q->state.push_back(std::uint8_t(b.state));
+                q->num_peers.push_back(std::uint16_t(b.num_peers));
+                q->bytes_progress.push_back(std::uint16_t(b.bytes_progress));
+                q->block_size.push_back(std::uint16_t(b.block_size));
+                tcp::endpoint const ep = b.peer();
+                if (ep == tcp::endpoint())
+                {
+                    q->peer.push_back(-1);
+                    continue;
+                }
+                auto const it = peer_index.insert(
+                    {ep, std::int32_t(q->peers.size())});
+                if (it.second) q->peers.push_back(ep);
+                q->peer.push_back(it.first->second);
+            }
+        }
+    }
+    return download_queue_view{std::move(q)};
+}
+
 void set_metadata(torrent_handle& handle, std::string const& buf)
 {
    handle.set_metadata(buf);
@@ -417,16 +759,86 @@ std::shared_ptr<const torrent_info> get_torrent_info(torrent_handle const& h)
 
 #endif // TORRENT_ABI_VERSION
 
-void add_piece_str(torrent_handle& th, piece_index_t piece, char const *data
+// the data passed to add_piece() must cover the whole piece. When we have
+// the metadata, make sure it does, rather than reading past the end of it
+void check_piece_buffer(torrent_info const* ti, piece_index_t const piece
+    , std::size_t const size)
+{
+    if (ti == nullptr || !ti->is_valid()) return;
+    if (piece < piece_index_t(0) || piece >= ti->end_piece())
+    {
+        PyErr_SetString(PyExc_IndexError, "piece index out of range");
+        throw_error_already_set();
+    }
+    if (size < std::size_t(ti->piece_size(piece)))
+    {
+        PyErr_SetString(PyExc_ValueError, "buffer is smaller than the piece");
+        throw_error_already_set();
+    }
+}
+
+// the UTF-8 representation is cached in the (immutable) str object, which
+// is kept alive for the duration of the call. It's safe to read it without
+// holding the GIL
+void add_piece_str(torrent_handle& th, piece_index_t piece, str data
     , add_piece_flags_t const flags)
 {
-    th.add_piece(piece, data, flags);
+    Py_ssize_t size = 0;
+    char const* buf = PyUnicode_AsUTF8AndSize(data.ptr(), &size);
+    if (buf == nullptr) throw_error_already_set();
+
+    std::shared_ptr<torrent_info const> ti;
+    {
+        allow_threading_guard guard;
+        ti = th.torrent_file();
+    }
+    check_piece_buffer(ti.get(), piece, std::size_t(size));
+
+    allow_threading_guard guard;
+    th.add_piece(piece, buf, flags);
 }
 
-void add_piece_bytes(torrent_handle& th, piece_index_t piece, bytes data
+// accepts any object supporting the buffer protocol. The data is only
+// copied once, into libtorrent's disk buffers
+void add_piece_buffer(torrent_handle& th, piece_index_t piece, object data
     , add_piece_flags_t const flags)
 {
-    th.add_piece(piece, data.arr.c_str(), flags);
+    buffer_view const buf(data.ptr());
+    std::shared_ptr<torrent_info const> ti;
+    {
+        allow_threading_guard guard;
+        ti = th.torrent_file();
+    }
+    check_piece_buffer(ti.get(), piece, buf.size());
+
+    allow_threading_guard guard;
+    th.add_piece(piece, buf.data(), flags);
+}
+
+// takes a sequence of (piece-index, buffer) tuples, and adds all of them
+// while releasing the GIL only once
+void add_pieces(torrent_handle& th, object pieces, add_piece_flags_t const flags)
+{
+    std::vector<std::pair<piece_index_t, buffer_view>> bufs;
+    stl_input_iterator<object> i(pieces), end;
+    for (; i != end; ++i)
+    {
+        object const item = *i;
+        bufs.emplace_back(extract<piece_index_t>(item[0])
+            , buffer_view(object(item[1]).ptr()));
+    }
+
+    std::shared_ptr<torrent_info const> ti;
+    {
+        allow_threading_guard guard;
+        ti = th.torrent_file();
+    }
+    for (auto const& b : bufs)
+        check_piece_buffer(ti.get(), b.first, b.second.size());
+
+    allow_threading_guard guard;
+    for (auto const& b : bufs)
+        th.add_piece(b.first, b.second.data(), flags);
 }
 
 class dummy5 {};
@@ -475,6 +887,20 @@ void bind_torrent_handle()
     ;
 #endif
 
+    class_<download_queue_view>("download_queue", no_init)
+        .add_property("piece_index", &download_queue_int32<&packed_download_queue::piece_index>)
+        .add_property("blocks_in_piece", &download_queue_int32<&packed_download_queue::blocks_in_piece>)
+        .add_property("first_block", &download_queue_int32<&packed_download_queue::first_block>)
+        .add_property("state", &download_queue_state)
+        .add_property("num_peers", &download_queue_uint16<&packed_download_queue::num_peers>)
+        .add_property("bytes_progress", &download_queue_uint16<&packed_download_queue::bytes_progress>)
+        .add_property("block_size", &download_queue_uint16<&packed_download_queue::block_size>)
+        .add_property("peer", &download_queue_int32<&packed_download_queue::peer>)
+        .add_property("peers", &download_queue_view::get_peers)
+        .def("__len__", &download_queue_view::len)
+        .def("__getitem__", &download_queue_view::getitem)
+        ;
+
     {
     scope s = class_<torrent_handle>("torrent_handle")
         .def(self == self)
@@ -482,9 +908,12 @@ void bind_torrent_handle()
         .def(self < self)
         .def("__hash__", (std::size_t (*)(torrent_handle const&))&libtorrent::hash_value)
         .def("get_peer_info", get_peer_info)
+        .def("peer_table", peer_table, (arg("fields")))
         .def("status", _(&torrent_handle::status), arg("flags") = 0xffffffff)
         .def("get_download_queue", get_download_queue)
+        .def("get_download_queue_packed", get_download_queue_packed)
         .def("file_progress", file_progress, arg("flags") = file_progress_flags_t{})
+        .def("file_progress_array", file_progress_array, arg("flags") = file_progress_flags_t{})
         .def("trackers", trackers)
         .def("replace_trackers", replace_trackers)
         .def("add_tracker", add_tracker)
@@ -506,8 +935,9 @@ void bind_torrent_handle()
         .def("queue_position_top", _(&torrent_handle::queue_position_top))
         .def("queue_position_bottom", _(&torrent_handle::queue_position_bottom))
 
+        .def("add_piece", add_piece_buffer)
         .def("add_piece", add_piece_str)
-        .def("add_piece", add_piece_bytes)
+        .def("add_pieces", add_pieces, (arg("pieces"), arg("flags") = 0))
         .def("read_piece", _(&torrent_handle::read_piece))
         .def("have_piece", _(&torrent_handle::have_piece))
         .def("set_piece_deadline", _(&torrent_handle::set_piece_deadline)
@@ -515,10 +945,12 @@ void bind_torrent_handle()
         .def("reset_piece_deadline", _(&torrent_handle::reset_piece_deadline), (arg("index")))
         .def("clear_piece_deadlines", _(&torrent_handle::clear_piece_deadlines), (arg("index")))
         .def("piece_availability", &piece_availability)
+        .def("piece_availability_array", &piece_availability_array)
         .def("piece_priority", _(piece_priority0))
         .def("piece_priority", _(piece_priority1))
         .def("prioritize_pieces", &prioritize_pieces)
         .def("get_piece_priorities", &piece_priorities)
+        .def("get_piece_priorities_array", &piece_priorities_array)
         .def("prioritize_files", &prioritize_files)
         .def("get_file_priorities", &file_priorities)
         .def("file_priority", &file_prioritity0)
@@ -7,6 +7,13 @@
 #include <libtorrent/bencode.hpp>
 #include <libtorrent/bdecode.hpp>
 #include "bytes.hpp"
+#include "buffer.hpp"
+#include "gil.hpp"
+#include <algorithm>
+#include <limits>
+#include <memory>
+#include <string>
+#include <vector>
 
 using namespace boost::python;
 using namespace lt;
@@ -96,16 +103,416 @@ object client_fingerprint_(peer_id const& id)
 }
 #endif
 
-entry bdecode_(bytes const& data)
+// sets data to the bencoded buffer behind o, if it's a bdecode_view_node
+bool bdecode_view_data(PyObject* o, span<char const>& data);
+
+namespace {
+
+// bencode() and bdecode() convert directly between python objects and their
+// bencoded form, without going through an intermediate entry. The
+// conversions mirror the entry converters in entry.cpp
+
+struct recursion_guard
+{
+    explicit recursion_guard(char const* where)
+    {
+        if (Py_EnterRecursiveCall(where) != 0) throw_error_already_set();
+    }
+    ~recursion_guard() { Py_LeaveRecursiveCall(); }
+    recursion_guard(recursion_guard const&) = delete;
+    recursion_guard& operator=(recursion_guard const&) = delete;
+};
+
+void write_string(std::string& out, char const* str, std::size_t const len)
+{
+    out += std::to_string(len);
+    out += ':';
+    out.append(str, len);
+}
+
+void write_integer(std::string& out, std::int64_t const val)
+{
+    out += 'i';
+    out += std::to_string(val);
+    out += 'e';
+}
+
+// returns false if o is not bytes, bytearray or str
+bool string_value(PyObject* o, char const*& str, std::size_t& len)
+{
+    if (PyBytes_Check(o))
+    {
+        str = PyBytes_AS_STRING(o);
+        len = std::size_t(PyBytes_GET_SIZE(o));
+    }
+    else if (PyByteArray_Check(o))
+    {
+        str = PyByteArray_AS_STRING(o);
+        len = std::size_t(PyByteArray_GET_SIZE(o));
+    }
+    else if (PyUnicode_Check(o))
+    {
+        Py_ssize_t size = 0;
+        str = PyUnicode_AsUTF8AndSize(o, &size);
+        if (str == nullptr) throw_error_already_set();
+        len = std::size_t(size);
+    }
+    else
+    {
+        return false;
+    }
+    return true;
+}
+
+void bencode_object(std::string& out, PyObject* o)
+{
+    recursion_guard guard(" while bencoding an object");
+
+    char const* str;
+    std::size_t len;
+    span<char const> section;
+    if (PyDict_Check(o))
+    {
+        // the keys have to be written in sorted order. Hold on to the keys
+        // and values, in case the dict is modified by a warning handler
+        struct item
+        {
+            string_view name;
+            object key;
+            object value;
+        };
+        std::vector<item> items;
+        items.reserve(std::size_t(PyDict_Size(o)));
+        PyObject* key;
+        PyObject* value;
+        Py_ssize_t pos = 0;
+        while (PyDict_Next(o, &pos, &key, &value))
+        {
+            if (!string_value(key, str, len))
+            {
+                PyErr_SetString(PyExc_TypeError, "bencoded dictionary keys must be strings");
+                throw_error_already_set();
+            }
+            items.push_back({string_view(str, len), object(borrowed(key))
+                , object(borrowed(value))});
+        }
+        std::stable_sort(items.begin(), items.end()
+            , [](item const& lhs, item const& rhs) { return lhs.name < rhs.name; });
+
+        out += 'd';
+        for (std::size_t i = 0; i < items.size(); ++i)
+        {
+            // like the entry converter, the first of several keys that
+            // compare equal (e.g. b"a" and "a") wins
+            if (i > 0 && items[i].name == items[i - 1].name) continue;
+            write_string(out, items[i].name.data(), items[i].name.size());
+            bencode_object(out, items[i].value.ptr());
+        }
+        out += 'e';
+    }
+    else if (PyList_Check(o))
+    {
+        out += 'l';
+        for (Py_ssize_t i = 0; i < PyList_GET_SIZE(o); ++i)
+        {
+            object const item(borrowed(PyList_GET_ITEM(o, i)));
+            bencode_object(out, item.ptr());
+        }
+        out += 'e';
+    }
+    else if (string_value(o, str, len))
+    {
+        write_string(out, str, len);
+    }
+    else if (PyLong_Check(o))
+    {
+        long long const val = PyLong_AsLongLong(o);
+        if (val == -1 && PyErr_Occurred()) throw_error_already_set();
+        write_integer(out, val);
+    }
+    else if (PyTuple_Check(o))
+    {
+        // a tuple of ints is a preformatted, already bencoded, buffer
+        for (Py_ssize_t i = 0; i < PyTuple_GET_SIZE(o); ++i)
+            out += char(extract<int>(PyTuple_GET_ITEM(o, i))());
+    }
+    else if (bdecode_view_data(o, section))
+    {
+        // a node of a bdecode_view() is already bencoded
+        out.append(section.data(), std::size_t(section.size()));
+    }
+    else
+    {
+        // same as the entry converter. Once that raises TypeError for these,
+        // so should this
+        python_deprecated("constructing a bencode entry from anything but "
+            "int, dict, list, string, bytes and int-tuple is deprecated");
+        out += "0:";
+    }
+}
+
+object decode_node(bdecode_node const& n)
 {
-    return bdecode(data.arr);
+    switch (n.type())
+    {
+    case bdecode_node::int_t:
+        return object(handle<>(PyLong_FromLongLong(n.int_value())));
+    case bdecode_node::string_t:
+        return object(handle<>(PyBytes_FromStringAndSize(n.string_ptr()
+            , n.string_length())));
+    case bdecode_node::list_t:
+    {
+        recursion_guard guard(" while bdecoding a list");
+        int const size = n.list_size();
+        handle<> ret(PyList_New(size));
+        for (int i = 0; i < size; ++i)
+        {
+            object item = decode_node(n.list_at(i));
+            PyList_SET_ITEM(ret.get(), i, incref(item.ptr()));
+        }
+        return object(ret);
+    }
+    case bdecode_node::dict_t:
+    {
+        recursion_guard guard(" while bdecoding a dictionary");
+        handle<> ret(PyDict_New());
+        int const size = n.dict_size();
+        for (int i = 0; i < size; ++i)
+        {
+            std::pair<string_view, bdecode_node> const item = n.dict_at(i);
+            handle<> key(PyBytes_FromStringAndSize(item.first.data()
+                , Py_ssize_t(item.first.size())));
+            object const value = decode_node(item.second);
+            if (PyDict_SetItem(ret.get(), key.get(), value.ptr()) != 0)
+                throw_error_already_set();
+        }
+        return object(ret);
+    }
+    default:
+        return object();
+    }
+}
+
+// bdecode() takes the buffer size as an int
+int bdecode_size(buffer_view const& buf)
+{
+    if (buf.size() > std::size_t(std::numeric_limits<int>::max()))
+    {
+        PyErr_SetString(PyExc_OverflowError, "bencoded buffer is too large");
+        throw_error_already_set();
+    }
+    return int(buf.size());
 }
 
-bytes bencode_(entry const& e)
+} // anonymous namespace
+
+// accepts any object supporting the buffer protocol
+object bdecode_(object const& data)
 {
-    bytes result;
-    bencode(std::back_inserter(result.arr), e);
-    return result;
+    buffer_view const buf(data.ptr());
+    int const size = bdecode_size(buf);
+    bdecode_node n;
+    {
+        allow_threading_guard guard;
+        n = bdecode({buf.data(), size});
+    }
+    return decode_node(n);
+}
+
+// the parsed bencoded buffer, shared by all the nodes of a bdecode_view().
+// The buffer is kept alive (and the exporting object can't resize it) for
+// as long as any node refers to it
+struct bdecode_root
+{
+    explicit bdecode_root(PyObject* o) : buf(o) {}
+    buffer_view buf;
+    bdecode_node node;
+};
+
+// python's view of a bdecode_node. Dictionaries and lists are decoded when
+// they're accessed. Their elements are returned as ints and bytes, or as
+// bdecode_view_node objects for nested dictionaries and lists
+struct bdecode_view_node
+{
+    std::shared_ptr<bdecode_root> root;
+    bdecode_node node;
+
+    object wrap(bdecode_node const& n) const
+    {
+        switch (n.type())
+        {
+        case bdecode_node::dict_t:
+        case bdecode_node::list_t:
+            return object(bdecode_view_node{root, n});
+        default:
+            return decode_node(n);
+        }
+    }
+
+    bdecode_node::type_t type() const { return node.type(); }
+
+    int len() const
+    {
+        switch (node.type())
+        {
+        case bdecode_node::dict_t: return node.dict_size();
+        case bdecode_node::list_t: return node.list_size();
+        case bdecode_node::string_t: return node.string_length();
+        default:
+            PyErr_SetString(PyExc_TypeError, "bdecode_node has no len()");
+            throw_error_already_set();
+            return 0;
+        }
+    }
+
+    bdecode_node find(object const& key) const
+    {
+        char const* str;
+        std::size_t len;
+        if (!string_value(key.ptr(), str, len))
+        {
+            PyErr_SetString(PyExc_TypeError, "bdecode_node keys must be strings");
+            throw_error_already_set();
+        }
+        return node.dict_find(string_view(str, len));
+    }
+
+    object getitem(object const& key) const
+    {
+        if (node.type() == bdecode_node::dict_t)
+        {
+            bdecode_node const v = find(key);
+            if (!v)
+            {
+                PyErr_SetObject(PyExc_KeyError, key.ptr());
+                throw_error_already_set();
+            }
+            return wrap(v);
+        }
+        if (node.type() == bdecode_node::list_t)
+        {
+            int i = extract<int>(key);
+            if (i < 0) i += node.list_size();
+            if (i < 0 || i >= node.list_size())
+            {
+                PyErr_SetString(PyExc_IndexError, "bdecode_node index out of range");
+                throw_error_already_set();
+            }
+            return wrap(node.list_at(i));
+        }
+        PyErr_SetString(PyExc_TypeError, "bdecode_node is not subscriptable");
+        throw_error_already_set();
+        return object();
+    }
+
+    object get(object const& key, object const& def) const
+    {
+        if (node.type() != bdecode_node::dict_t) return getitem(key);
+        bdecode_node const v = find(key);
+        return v ? wrap(v) : def;
+    }
+
+    bool contains(object const& key) const
+    {
+        if (node.type() != bdecode_node::dict_t)
+        {
+            PyErr_SetString(PyExc_TypeError, "only dictionary bdecode_nodes support 'in'");
+            throw_error_already_set();
+        }
+        return bool(find(key));
+    }
+
+    list keys() const
+    {
+        list ret;
+        for (int i = 0; i < dict_size(); ++i)
+        {
+            string_view const k = node.dict_at(i).first;
+            ret.append(object(handle<>(PyBytes_FromStringAndSize(k.data()
+                , Py_ssize_t(k.size())))));
+        }
+        return ret;
+    }
+
+    list values() const
+    {
+        list ret;
+        if (node.type() == bdecode_node::list_t)
+        {
+            for (int i = 0; i < node.list_size(); ++i)
+                ret.append(wrap(node.list_at(i)));
+        }
+        for (int i = 0; i < dict_size(); ++i)
+            ret.append(wrap(node.dict_at(i).second));
+        return ret;
+    }
+
+    list items() const
+    {
+        list ret;
+        for (int i = 0; i < dict_size(); ++i)
+        {
+            std::pair<string_view, bdecode_node> const item = node.dict_at(i);
+            ret.append(boost::python::make_tuple(
+                object(handle<>(PyBytes_FromStringAndSize(item.first.data()
+                    , Py_ssize_t(item.first.size()))))
+                , wrap(item.second)));
+        }
+        return ret;
+    }
+
+    // iterating over a dictionary yields its keys, like a dict
+    object iter() const
+    {
+        list const l = node.type() == bdecode_node::list_t ? values() : keys();
+        return object(handle<>(PyObject_GetIter(l.ptr())));
+    }
+
+    object decode() const { return decode_node(node); }
+
+    // the bencoded representation of this node, as a memoryview of the
+    // buffer it was parsed from
+    object data() const
+    {
+        span<char const> const section = node.data_section();
+        return make_memoryview(std::shared_ptr<char const>(root, section.data())
+            , std::size_t(section.size()));
+    }
+
+private:
+    int dict_size() const
+    {
+        return node.type() == bdecode_node::dict_t ? node.dict_size() : 0;
+    }
+};
+
+bool bdecode_view_data(PyObject* o, span<char const>& data)
+{
+    extract<bdecode_view_node const&> n(o);
+    if (!n.check()) return false;
+    data = n().node.data_section();
+    return true;
+}
+
+// parses the buffer without converting it to python objects
+bdecode_view_node bdecode_view(object const& data)
+{
+    auto root = std::make_shared<bdecode_root>(data.ptr());
+    int const size = bdecode_size(root->buf);
+    {
+        allow_threading_guard guard;
+        root->node = bdecode({root->buf.data(), size});
+    }
+    bdecode_node const n = root->node.non_owning();
+    return bdecode_view_node{std::move(root), n};
+}
+
+object bencode_(object const& e)
+{
+    std::string out;
+    bencode_object(out, e.ptr());
+    return object(handle<>(PyBytes_FromStringAndSize(out.data()
+        , Py_ssize_t(out.size()))));
 }
 
 void bind_utility()
@@ -122,6 +529,29 @@ void bind_utility()
 #endif
     def("bdecode", &bdecode_);
     def("bencode", &bencode_);
+    def("bdecode_view", &bdecode_view);
+
+    scope s = class_<bdecode_view_node>("bdecode_node", no_init)
+        .add_property("type", &bdecode_view_node::type)
+        .def("__len__", &bdecode_view_node::len)
+        .def("__getitem__", &bdecode_view_node::getitem)
+        .def("__contains__", &bdecode_view_node::contains)
+        .def("__iter__", &bdecode_view_node::iter)
+        .def("get", &bdecode_view_node::get, (arg("key"), arg("default") = object()))
+        .def("keys", &bdecode_view_node::keys)
+        .def("values", &bdecode_view_node::values)
+        .def("items", &bdecode_view_node::items)
+        .def("decode", &bdecode_view_node::decode)
+        .def("data", &bdecode_view_node::data)
+        ;
+
+    enum_<bdecode_node::type_t>("type_t")
+        .value("none_t", bdecode_node::none_t)
+        .value("dict_t", bdecode_node::dict_t)
+        .value("list_t", bdecode_node::list_t)
+        .value("string_t", bdecode_node::string_t)
+        .value("int_t", bdecode_node::int_t)
+        ;
 }
 
 #ifdef _MSC_VER
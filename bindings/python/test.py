@@ -17,8 +17,13 @@ import threading
 import tempfile
 import socket
 import select
+import asyncio
+import array
+import io
+import mmap
 
 import dummy_data
+import libtorrent_aio
 
 # include terminal interface for travis parallel executions of scripts which use
 # terminal features: fix multiple stdin assignment at termios.tcgetattr
@@ -75,6 +80,102 @@ class test_create_torrent(unittest.TestCase):
 
         self.assertEqual(encoded, b'd8:announce3:bar13:creation datei0e9:httpseeds3:bar4:infod11:collectionsl4:1337e5:filesld6:lengthi1000e4:pathl5:file1eed4:attr1:p6:lengthi15384e4:pathl4:.pad5:15384eed6:lengthi2000e4:pathl5:file2eee4:name4:test12:piece lengthi16384e6:pieces40:abababababababababababababababababababab8:ssl-cert10:1234567890e8:url-list3:fooe')
 
+    def test_write_to(self):
+        fs = lt.file_storage()
+        fs.add_file('test/file1', 1000)
+        fs.add_file('test/file2', 2000)
+        ct = lt.create_torrent(fs, 16384, lt.create_torrent.v1_only)
+        for i in range(ct.num_pieces()):
+            ct.set_hash(i, b'abababababababababab')
+        expected = lt.bencode(ct.generate())
+
+        f = io.BytesIO()
+        self.assertEqual(ct.write_to(f), len(expected))
+        self.assertEqual(f.getvalue(), expected)
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'test.torrent')
+            ct.write_to(path)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_parallel_piece_hashes(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, 'data'), 'wb') as f:
+                f.write(os.urandom(16384 * 10 + 100))
+            fs = lt.file_storage()
+            lt.add_files(fs, os.path.join(d, 'data'))
+
+            ct1 = lt.create_torrent(fs, 16384)
+            lt.set_piece_hashes(ct1, d)
+
+            ct2 = lt.create_torrent(fs, 16384)
+            progress = []
+            lt.set_piece_hashes(ct2, d, callback=progress.append, threads=4,
+                                read_ahead=4 * 16384, batch_size=4)
+            self.assertEqual(progress, [4, 8, 11])
+            self.assertEqual(lt.torrent_info(ct1.generate()).info_hashes(),
+                             lt.torrent_info(ct2.generate()).info_hashes())
+
+    def test_add_files_ignore(self):
+        with tempfile.TemporaryDirectory() as d:
+            root = os.path.join(d, 'test')
+            for path in ['a', 'b.tmp', 'Thumbs.db', '.hidden', 'sub/c',
+                         'sub/d.tmp', '.git/e', 'sub/sub/f']:
+                path = os.path.join(root, path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(b'x' * 10)
+
+            def scan(**kwargs):
+                fs = lt.file_storage()
+                lt.add_files(fs, root, ignore=['Thumbs.db', '*.tmp'],
+                             ignore_hidden=True, **kwargs)
+                return [fs.file_path(i) for i in range(fs.num_files())]
+
+            expected = [os.path.join('test', p) for p in
+                        ['a', os.path.join('sub', 'c'),
+                         os.path.join('sub', 'sub', 'f')]]
+            self.assertEqual(scan(threads=1), expected)
+            self.assertEqual(scan(threads=4), expected)
+
+    def test_piece_hash_cache(self):
+        with tempfile.TemporaryDirectory() as d:
+            os.mkdir(os.path.join(d, 'test'))
+            for name, size in [('a', 16384 * 3 + 100), ('b', 16384 * 2)]:
+                with open(os.path.join(d, 'test', name), 'wb') as f:
+                    f.write(os.urandom(size))
+            fs = lt.file_storage()
+            lt.add_files(fs, os.path.join(d, 'test'))
+
+            def make(cache):
+                ct = lt.create_torrent(fs, 16384)
+                lt.set_piece_hashes(ct, d, cache=cache)
+                return lt.torrent_info(ct.generate()).info_hashes()
+
+            num_pieces = lt.create_torrent(fs, 16384).num_pieces()
+            cache = lt.hash_cache()
+            expected = make(cache)
+            self.assertEqual(cache.hits, 0)
+            self.assertEqual(cache.misses, num_pieces)
+
+            # nothing has changed, so nothing needs to be hashed
+            loaded = lt.hash_cache()
+            loaded.load(cache.save())
+            self.assertEqual(len(loaded), len(cache))
+            self.assertEqual(make(loaded), expected)
+            self.assertEqual(loaded.hits, num_pieces)
+            self.assertEqual(loaded.misses, 0)
+
+            # only the pieces of the modified file are hashed again
+            path = os.path.join(d, 'test', 'b')
+            with open(path, 'wb') as f:
+                f.write(os.urandom(16384 * 2))
+            st = os.stat(path)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+            self.assertEqual(make(loaded), make(None))
+            self.assertEqual(loaded.misses, 2)
+
 
 class test_session_stats(unittest.TestCase):
 
@@ -115,6 +216,36 @@ class test_torrent_handle(unittest.TestCase):
             'ti': self.ti, 'save_path': os.getcwd(),
             'flags': lt.torrent_flags.default_flags})
 
+    def setup_swarm(self):
+        # a seed with its upload throttled, so the downloader keeps a
+        # download queue, and a downloader connected to it
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        seed_dir = os.path.join(self.dir.name, 'seed')
+        os.mkdir(seed_dir)
+        with open(os.path.join(seed_dir, dummy_data.NAME.decode()), 'wb') as f:
+            f.write(dummy_data.DATA)
+        self.ti = lt.torrent_info(dummy_data.DICT)
+
+        local_settings = dict(settings, listen_interfaces='127.0.0.1:0')
+        self.seed_ses = lt.session(local_settings)
+        local_class = self.seed_ses.get_peer_class(lt.session.local_peer_class_id)
+        local_class['upload_limit'] = 1024
+        self.seed_ses.set_peer_class(lt.session.local_peer_class_id, local_class)
+        self.seed_ses.add_torrent({'ti': self.ti, 'save_path': seed_dir,
+                                   'flags': lt.torrent_flags.seed_mode})
+
+        self.ses = lt.session(local_settings)
+        self.h = self.ses.add_torrent({'ti': self.ti, 'save_path': os.path.join(self.dir.name, 'dl')})
+        self.h.connect_peer(('127.0.0.1', self.seed_ses.listen_port()))
+
+        for i in range(100):
+            peers = self.h.get_peer_info()
+            if len(peers) == 1 and peers[0].progress == 1.0 and self.h.get_download_queue():
+                return peers[0]
+            time.sleep(0.1)
+        self.fail('failed to connect to the seed')
+
     def test_add_torrent_error(self):
         self.ses = lt.session(settings)
         self.ti = lt.torrent_info('url_seed_multi.torrent')
@@ -157,6 +288,94 @@ class test_torrent_handle(unittest.TestCase):
 
         print(self.h.queue_position())
 
+    def test_piece_arrays(self):
+        self.setup()
+        prio = self.h.get_piece_priorities_array()
+        self.assertIsInstance(prio, array.array)
+        self.assertEqual(prio.typecode, 'B')
+        self.assertEqual(list(prio), self.h.get_piece_priorities())
+
+        self.h.prioritize_pieces(array.array('B', [2]))
+        self.assertEqual(list(self.h.get_piece_priorities_array()), [2])
+        self.h.prioritize_pieces(array.array('i', [3]))
+        self.assertEqual(list(self.h.get_piece_priorities_array()), [3])
+        self.h.prioritize_pieces(bytes([5]))
+        self.assertEqual(self.h.get_piece_priorities(), [5])
+        with self.assertRaises(TypeError):
+            self.h.prioritize_pieces(array.array('d', [1.]))
+        with self.assertRaises(ValueError):
+            self.h.prioritize_pieces(array.array('i', [8]))
+        with self.assertRaises(ValueError):
+            self.h.prioritize_pieces(array.array('i', [-1]))
+        self.assertEqual(self.h.get_piece_priorities(), [5])
+
+        avail = self.h.piece_availability_array()
+        self.assertEqual(avail.typecode, 'i')
+        self.assertEqual(list(avail), self.h.piece_availability())
+
+        progress = self.h.file_progress_array()
+        self.assertEqual(progress.typecode, 'q')
+        self.assertEqual(list(progress), self.h.file_progress())
+
+    def test_peer_table(self):
+        self.setup()
+        table = self.h.peer_table(['flags', 'down_speed', 'progress', 'ip', 'pieces'])
+        self.assertEqual(sorted(table.keys()), ['down_speed', 'flags', 'ip', 'pieces', 'progress'])
+        self.assertEqual(table['flags'].typecode, 'I')
+        self.assertEqual(table['progress'].typecode, 'f')
+        self.assertEqual(len(table['down_speed']), 0)
+        self.assertEqual(table['pieces'], b'')
+
+        peer = self.setup_swarm()
+        table = self.h.peer_table(['flags', 'progress', 'ip', 'pid', 'pieces'])
+        self.assertEqual(list(table['flags']), [peer.flags])
+        self.assertTrue(table['flags'][0] & lt.peer_info.seed)
+        self.assertEqual(list(table['progress']), [1.0])
+        self.assertEqual(table['ip'], [peer.ip])
+        self.assertEqual(table['pid'], [peer.pid])
+        # 10 pieces, the first one in the most significant bit
+        self.assertEqual(self.ti.num_pieces(), 10)
+        self.assertEqual(table['pieces'], b'\xff\xc0')
+        with self.assertRaises(KeyError):
+            self.h.peer_table(['no_such_field'])
+
+    def test_download_queue_packed(self):
+        self.setup_swarm()
+        # the download is throttled, but blocks may still make progress
+        # between the two calls. Use a snapshot that didn't change
+        for i in range(10):
+            dq = self.h.get_download_queue()
+            q = self.h.get_download_queue_packed()
+            if self.h.get_download_queue() == dq:
+                break
+        self.assertEqual(q.piece_index.format, 'i')
+        self.assertEqual(q.state.format, 'B')
+        self.assertEqual(q.num_peers.format, 'H')
+        self.assertGreater(len(dq), 0)
+        self.assertEqual(len(q), len(dq))
+        self.assertEqual(len(q.piece_index), len(dq))
+        self.assertEqual(len(q.state), sum(q.blocks_in_piece))
+        self.assertEqual(len(q.peer), len(q.state))
+        self.assertEqual(q.peers, [('127.0.0.1', self.seed_ses.listen_port())])
+
+        for i, piece in enumerate(dq):
+            self.assertEqual(q.piece_index[i], piece['piece_index'])
+            self.assertEqual(q.blocks_in_piece[i], piece['blocks_in_piece'])
+            first = q.first_block[i]
+            for k, block in enumerate(piece['blocks']):
+                self.assertEqual(q.state[first + k], block['state'])
+                self.assertEqual(q.num_peers[first + k], block['num_peers'])
+                self.assertEqual(q.bytes_progress[first + k], block['bytes_progress'])
+                self.assertEqual(q.block_size[first + k], block['block_size'])
+                if q.peer[first + k] == -1:
+                    self.assertEqual(block['peer'], ('0.0.0.0', 0))
+                else:
+                    self.assertEqual(q.peers[q.peer[first + k]], block['peer'])
+            self.assertEqual(q[i], piece)
+        self.assertEqual(list(q), dq)
+        with self.assertRaises(IndexError):
+            q[len(q)]
+
     def test_torrent_handle_in_set(self):
         self.setup()
         torrents = set()
@@ -269,6 +488,51 @@ class test_torrent_handle(unittest.TestCase):
         self.assertEqual(st2, st)
         print(st2)
 
+    def test_torrent_status_table(self):
+        self.setup()
+        table = self.ses.torrent_status_table(
+            ['handle', 'state', 'progress_ppm', 'total_wanted', 'progress', 'flags'])
+        self.assertEqual(len(table['handle']), 1)
+        self.assertEqual(table['handle'][0], self.h)
+        st = self.h.status()
+        self.assertEqual(table['state'].typecode, 'i')
+        self.assertEqual(table['total_wanted'].typecode, 'q')
+        self.assertEqual(table['progress'].typecode, 'f')
+        self.assertEqual(table['total_wanted'][0], st.total_wanted)
+        self.assertEqual(table['flags'][0], st.flags)
+
+        with self.assertRaises(KeyError):
+            self.ses.torrent_status_table(['no_such_field'])
+
+    def test_torrent_status_filter(self):
+        self.setup()
+        self.h.pause()
+        self.h.unset_flags(lt.torrent_flags.auto_managed)
+        all_states = list(lt.torrent_status.states.values.values())
+
+        ret = self.ses.get_torrent_status({'states': all_states})
+        self.assertEqual(len(ret), 1)
+        self.assertEqual(ret[0].handle, self.h)
+
+        ret = self.ses.get_torrent_status({'flags': lt.torrent_flags.paused})
+        self.assertEqual(len(ret), 1)
+        ret = self.ses.get_torrent_status({
+            'flags': 0, 'flags_mask': lt.torrent_flags.paused})
+        self.assertEqual(len(ret), 0)
+        ret = self.ses.get_torrent_status({'min_download_rate': 1})
+        self.assertEqual(len(ret), 0)
+
+        table = self.ses.torrent_status_table(
+            ['handle'], filter={'states': []})
+        self.assertEqual(len(table['handle']), 0)
+
+        # the predicate overload still works
+        ret = self.ses.get_torrent_status(lambda st: True)
+        self.assertEqual(len(ret), 1)
+
+        with self.assertRaises(KeyError):
+            self.ses.get_torrent_status({'no_such_key': 1})
+
     def test_read_resume_data(self):
 
         resume_data = lt.bencode({
@@ -384,6 +648,52 @@ class TestAddPiece(unittest.TestCase):
 
         self.wait_until_torrent_finished()
 
+    def test_with_buffer(self):
+        for i, data in enumerate(dummy_data.PIECES):
+            buf = bytearray(data) if i % 2 == 0 else memoryview(data)
+            self.handle.add_piece(i, buf, 0)
+
+        self.wait_until_torrent_finished()
+
+    def test_add_pieces(self):
+        self.handle.add_pieces(list(enumerate(dummy_data.PIECES)))
+
+        self.wait_until_torrent_finished()
+
+    def test_short_buffer(self):
+        with self.assertRaises(ValueError):
+            self.handle.add_piece(0, dummy_data.PIECES[0][:-1], 0)
+        with self.assertRaises(ValueError):
+            self.handle.add_piece(0, dummy_data.PIECES[0][:-1].decode(), 0)
+        with self.assertRaises(IndexError):
+            self.handle.add_pieces([(len(dummy_data.PIECES), dummy_data.PIECES[0])])
+
+    def test_read_piece_buffer_view(self):
+        for i, data in enumerate(dummy_data.PIECES):
+            self.handle.add_piece(i, data, 0)
+        self.wait_until_torrent_finished()
+
+        self.handle.read_piece(0)
+        alert = None
+        deadline = time.time() + 5
+        while alert is None and time.time() < deadline:
+            self.session.wait_for_alert(1000)
+            for a in self.session.pop_alerts():
+                if isinstance(a, lt.read_piece_alert):
+                    alert = a
+        self.assertIsNotNone(alert)
+        view = alert.buffer_view
+        self.assertTrue(view.readonly)
+        self.assertEqual(len(view), alert.size)
+        self.assertEqual(view, alert.buffer)
+        self.assertEqual(bytes(view), dummy_data.PIECES[0])
+
+        # the view remains valid once the alert is gone
+        self.session.post_session_stats()
+        self.session.wait_for_alert(1000)
+        self.session.pop_alerts()
+        self.assertEqual(bytes(view), dummy_data.PIECES[0])
+
 
 class test_torrent_info(unittest.TestCase):
 
@@ -568,6 +878,33 @@ class test_alerts(unittest.TestCase):
         print(st.last_download)
         self.assertEqual(st.save_path, os.getcwd())
 
+    def test_state_update_alert(self):
+        ses = lt.session(settings)
+        ti = lt.torrent_info('base.torrent')
+        h = ses.add_torrent({'ti': ti, 'save_path': os.getcwd()})
+        ses.post_torrent_updates()
+
+        alert = None
+        deadline = time.time() + 5
+        while alert is None and time.time() < deadline:
+            ses.wait_for_alert(1000)
+            for a in ses.pop_alerts():
+                if isinstance(a, lt.state_update_alert):
+                    alert = a
+        self.assertIsNotNone(alert)
+
+        view = alert.status_view
+        self.assertEqual(len(view), len(alert.status))
+        self.assertEqual(list(view), alert.status)
+        self.assertEqual(view[-1], alert.status[-1])
+        with self.assertRaises(IndexError):
+            view[len(view)]
+
+        table = alert.status_table(['handle', 'progress_ppm'])
+        self.assertEqual(table['handle'], [st.handle for st in alert.status])
+        self.assertEqual(list(table['progress_ppm']), [st.progress_ppm for st in alert.status])
+        self.assertIn(h, table['handle'])
+
     def test_alert_fs(self):
         ses = lt.session(settings)
         s1, s2 = socket.socketpair()
@@ -605,6 +942,33 @@ class test_alerts(unittest.TestCase):
                 print(a.message())
             time.sleep(0.1)
 
+    def test_pop_alerts_into(self):
+        ses = lt.session(settings)
+        buf = [None] * 16
+
+        # pop alerts until one of the wanted type shows up
+        def pop_until(cls, types=None):
+            for i in range(100):
+                ses.wait_for_alert(1000)
+                n = ses.pop_alerts_into(buf, types=types)
+                self.assertEqual(n, len(buf))
+                if any(isinstance(a, cls) for a in buf):
+                    return
+            self.fail('no %s posted' % cls.__name__)
+
+        ses.post_dht_stats()
+        ses.post_session_stats()
+        pop_until(lt.session_stats_alert, types=[lt.session_stats_alert])
+        for a in buf:
+            self.assertTrue(isinstance(a, lt.session_stats_alert))
+
+        # with no filter, every alert is returned and the list is reused
+        ses.post_dht_stats()
+        pop_until(lt.dht_stats_alert)
+
+        with self.assertRaises(TypeError):
+            ses.pop_alerts_into(buf, types=[1])
+
     def test_alert_notify(self):
         ses = lt.session(settings)
         event = threading.Event()
@@ -618,6 +982,61 @@ class test_alerts(unittest.TestCase):
         event.wait()
 
 
+class test_aio(unittest.TestCase):
+
+    def test_alert_loop(self):
+        async def run():
+            ses = lt.session(settings)
+            loop = libtorrent_aio.alert_loop(ses)
+            ti = lt.torrent_info('base.torrent')
+            h = await asyncio.wait_for(loop.add_torrent(
+                {'ti': ti, 'save_path': os.getcwd()}), 10)
+            self.assertEqual(h.info_hashes(), ti.info_hashes())
+
+            atp = await asyncio.wait_for(loop.save_resume_data(h), 10)
+            self.assertEqual(atp.info_hashes, ti.info_hashes())
+
+            ses.post_session_stats()
+
+            async def first_stats_alert():
+                alerts = loop.alerts()
+                try:
+                    async for a in alerts:
+                        if isinstance(a, lt.session_stats_alert):
+                            return a.counters_view
+                finally:
+                    await alerts.aclose()
+
+            counters = await asyncio.wait_for(first_stats_alert(), 10)
+            self.assertTrue(len(counters) > 0)
+
+            # leave the iterator while it still holds a batch, with a helper
+            # waiting on another task. Closing the generator must pop the
+            # alert the helper is waiting for
+            async def break_out():
+                alerts = loop.alerts()
+                try:
+                    async for a in alerts:
+                        task = asyncio.ensure_future(loop.save_resume_data(h))
+                        # let the alert be posted while we hold the batch
+                        await asyncio.sleep(0.5)
+                        return task
+                finally:
+                    await alerts.aclose()
+
+            ses.post_session_stats()
+            task = await asyncio.wait_for(break_out(), 10)
+            atp = await asyncio.wait_for(task, 10)
+            self.assertEqual(atp.info_hashes, ti.info_hashes())
+
+            loop.close()
+            # the session no longer writes to the closed socket
+            ses.post_session_stats()
+            ses.wait_for_alert(1000)
+
+        asyncio.run(run())
+
+
 class test_bencoder(unittest.TestCase):
 
     def test_bencode(self):
@@ -656,6 +1075,97 @@ class test_bencoder(unittest.TestCase):
         encoded = lt.bencode((1, 2, 3, 4, 5))
         self.assertEqual(encoded, b'\x01\x02\x03\x04\x05')
 
+    def test_sorted_keys(self):
+        encoded = lt.bencode({b'b': 1, 'a': 2, b'a': 3})
+        self.assertEqual(encoded, b'd1:ai2e1:bi1ee')
+
+    def test_invalid_key(self):
+        with self.assertRaises(TypeError):
+            lt.bencode({1: 2})
+
+    def test_recursive(self):
+        a = []
+        a.append(a)
+        with self.assertRaises(RecursionError):
+            lt.bencode(a)
+
+    def test_bdecode_buffer(self):
+        decoded = lt.bdecode(memoryview(b'li-5e3:fooe'))
+        self.assertEqual(decoded, [-5, b'foo'])
+        decoded = lt.bdecode(bytearray(b'i42e'))
+        self.assertEqual(decoded, 42)
+
+    def test_bdecode_invalid(self):
+        with self.assertRaises(RuntimeError):
+            lt.bdecode(b'li1e')
+
+    def test_round_trip(self):
+        data = {b'a': [1, {b'b': b'\x00\xff'}, []], b'c': {}, b'd': -(2 ** 63) + 1}
+        self.assertEqual(lt.bdecode(lt.bencode(data)), data)
+
+
+class test_bdecode_view(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {b'announce': b'http://example.com',
+                     b'info': {b'name': b'foo', b'piece length': 16384,
+                               b'files': [{b'length': 1, b'path': [b'a']}]}}
+        self.encoded = lt.bencode(self.data)
+
+    def test_dict(self):
+        v = lt.bdecode_view(self.encoded)
+        self.assertEqual(v.type, lt.bdecode_node.type_t.dict_t)
+        self.assertEqual(len(v), 2)
+        self.assertEqual(v.keys(), [b'announce', b'info'])
+        self.assertEqual(list(v), [b'announce', b'info'])
+        info = v[b'info']
+        self.assertEqual(info['name'], b'foo')
+        self.assertEqual(info[b'piece length'], 16384)
+        self.assertIn(b'files', info)
+        self.assertNotIn(b'pieces', info)
+        self.assertIsNone(info.get(b'pieces'))
+        with self.assertRaises(KeyError):
+            info[b'pieces']
+
+    def test_list(self):
+        files = lt.bdecode_view(self.encoded)[b'info'][b'files']
+        self.assertEqual(files.type, lt.bdecode_node.type_t.list_t)
+        self.assertEqual(len(files), 1)
+        self.assertEqual(files[-1][b'path'][0], b'a')
+        self.assertEqual(files[0].decode(), {b'length': 1, b'path': [b'a']})
+        with self.assertRaises(IndexError):
+            files[1]
+
+    def test_decode(self):
+        v = lt.bdecode_view(bytearray(self.encoded))
+        self.assertEqual(v.decode(), self.data)
+        self.assertEqual(bytes(v[b'info'].data()), lt.bencode(self.data[b'info']))
+
+    def test_bencode(self):
+        v = lt.bdecode_view(self.encoded)
+        self.assertEqual(lt.bencode(v), self.encoded)
+        self.assertEqual(lt.bencode({b'info': v[b'info']}),
+                         lt.bencode({b'info': self.data[b'info']}))
+
+    def test_invalid(self):
+        with self.assertRaises(RuntimeError):
+            lt.bdecode_view(b'd1:a')
+
+    @unittest.skipIf(sys.maxsize < 2 ** 32, 'requires a 64 bit address space')
+    def test_too_large(self):
+        # a sparse file, mapped without touching its pages
+        with tempfile.TemporaryFile() as f:
+            f.truncate(2 ** 31)
+            m = mmap.mmap(f.fileno(), 2 ** 31, access=mmap.ACCESS_READ)
+            try:
+                with self.assertRaises(OverflowError):
+                    lt.bdecode_view(m)
+                with self.assertRaises(OverflowError):
+                    lt.bdecode(m)
+            finally:
+                m.close()
+
+
 class test_sha1hash(unittest.TestCase):
 
     def test_sha1hash(self):
@@ -908,6 +1418,104 @@ class test_session(unittest.TestCase):
         self.assertEqual(s.get_settings()['num_want'], 66)
         self.assertEqual(s.get_settings()['user_agent'], 'test123')
 
+    def test_settings_pack(self):
+        s = lt.session(settings)
+        idx = lt.settings_pack.index('num_want')
+        p = lt.settings_pack({'user_agent': 'test123'})
+        p.set_int(idx, 66)
+        p['enable_incoming_utp'] = False
+        self.assertEqual(p[idx], 66)
+        self.assertEqual(p['num_want'], 66)
+        self.assertTrue('user_agent' in p)
+        self.assertFalse('enable_dht' in p)
+        with self.assertRaises(TypeError):
+            p.set_bool(idx, True)
+        with self.assertRaises(KeyError):
+            lt.settings_pack.index('no_such_setting')
+
+        s.apply_settings(p)
+        self.assertEqual(s.get_settings(keys=[idx, 'user_agent', 'enable_incoming_utp']),
+                         {idx: 66, 'user_agent': 'test123', 'enable_incoming_utp': False})
+
+        p[idx] = 67
+        s.apply_settings(p)
+        self.assertEqual(s.get_settings(keys=['num_want']), {'num_want': 67})
+
+        # settings changed some other way are applied again
+        s.apply_settings({'num_want': 10, 'user_agent': 'foo'})
+        s.apply_settings(p)
+        self.assertEqual(s.get_settings(keys=['num_want', 'user_agent']),
+                         {'num_want': 67, 'user_agent': 'test123'})
+
+        # as is the whole pack, when applied to another session
+        s2 = lt.session(settings)
+        s2.apply_settings(p)
+        self.assertEqual(s2.get_settings(keys=[idx, 'user_agent', 'enable_incoming_utp']),
+                         {idx: 67, 'user_agent': 'test123', 'enable_incoming_utp': False})
+
+        params = lt.session_params()
+        params.settings = p
+        self.assertEqual(params.settings['num_want'], 67)
+        self.assertEqual(params.settings['user_agent'], 'test123')
+        params.settings = {'num_want': 5}
+        self.assertEqual(params.settings['num_want'], 5)
+
+    def test_async_add_torrents(self):
+        s = lt.session(settings)
+
+        atp = lt.add_torrent_params()
+        atp.info_hashes = lt.info_hash_t(lt.sha1_hash(b'b' * 20))
+        atp.save_path = '.'
+        resume = lt.add_torrent_params()
+        resume.info_hashes = lt.info_hash_t(lt.sha1_hash(b'c' * 20))
+        resume.save_path = '.'
+
+        with self.assertRaises(RuntimeError):
+            s.async_add_torrents([atp, b'not resume data'])
+
+        s.async_add_torrents([
+            {'info_hashes': b'a' * 20, 'save_path': '.'},
+            atp, lt.write_resume_data_buf(resume)])
+
+        added = set()
+        deadline = time.time() + 10
+        while len(added) < 3 and time.time() < deadline:
+            s.wait_for_alert(1000)
+            for a in s.pop_alerts():
+                if isinstance(a, lt.add_torrent_alert):
+                    self.assertEqual(a.error.value(), 0)
+                    added.add(str(a.handle.info_hashes().v1))
+        self.assertEqual(added, {str(lt.sha1_hash(c * 20)) for c in [b'a', b'b', b'c']})
+        self.assertEqual(len(s.get_torrents()), 3)
+
+    def test_load_resume_data(self):
+        with tempfile.TemporaryDirectory() as d:
+            for c in [b'a', b'b', b'c']:
+                atp = lt.add_torrent_params()
+                atp.info_hashes = lt.info_hash_t(lt.sha1_hash(c * 20))
+                atp.save_path = '.'
+                with open(os.path.join(d, '%s.fastresume' % c.decode()), 'wb') as f:
+                    f.write(lt.write_resume_data_buf(atp))
+            with open(os.path.join(d, 'd.fastresume'), 'wb') as f:
+                f.write(b'not resume data')
+            with open(os.path.join(d, 'e.txt'), 'wb') as f:
+                f.write(b'not a resume file')
+            os.mkdir(os.path.join(d, 'f.fastresume'))
+
+            errors = []
+            for use_mmap in [False, True]:
+                s = lt.session(settings)
+                failed = s.load_resume_data(d + os.sep, threads=2, batch_size=2, mmap=use_mmap)
+                self.assertEqual([path for path, error in failed],
+                                 [os.path.join(d, 'd.fastresume'), os.path.join(d, 'f.fastresume')])
+                errors.append([(error.category().name(), error.value()) for path, error in failed])
+
+                deadline = time.time() + 10
+                while len(s.get_torrents()) < 3 and time.time() < deadline:
+                    time.sleep(0.1)
+                self.assertEqual(len(s.get_torrents()), 3)
+            self.assertEqual(errors[0], errors[1])
+
     def test_post_session_stats(self):
         s = lt.session({'alert_mask': 0, 'enable_dht': False})
         s.post_session_stats()
@@ -933,6 +1541,16 @@ class test_session(unittest.TestCase):
         self.assertTrue(isinstance(a.values, dict))
         self.assertTrue(len(a.values) > 0)
 
+        counters = a.counters_view
+        names = lt.session_stats_metric_names()
+        self.assertEqual(counters.typecode, 'q')
+        self.assertEqual(len(counters), len(names))
+        values = a.values
+        for i, name in enumerate(names):
+            self.assertEqual(counters[i], values[name])
+        idx = lt.find_metric_idx('ses.num_incoming_request')
+        self.assertEqual(names[idx], 'ses.num_incoming_request')
+
     def test_post_dht_stats(self):
         s = lt.session({'alert_mask': 0, 'enable_dht': False})
         s.post_dht_stats()
@@ -271,6 +271,12 @@ namespace libtorrent {
 		// object constructed with the v1_only flag.
 		void set_hash2(file_index_t file, piece_index_t::diff_type piece, sha256_hash const& h);
 
+		// return the hashes set by set_hash() and set_hash2() (or
+		// set_piece_hashes()) respectively. A hash that has not been set is
+		// returned as all zeros.
+		sha1_hash hash(piece_index_t index) const;
+		sha256_hash hash2(file_index_t file, piece_index_t::diff_type piece) const;
+
 #if TORRENT_ABI_VERSION < 3
 		// This sets the sha1 hash for this file. This hash will end up under the key ``sha1``
 		// associated with this file (for multi-file torrents) or in the root info dictionary
@@ -450,8 +456,16 @@ namespace aux {
 	//
 	// The ``flags`` argument should be the same as the flags passed to the `create_torrent`_
 	// constructor.
+	//
+	// The overload taking ``num_threads`` lists directories and stats files on
+	// that many threads, which is a lot faster for large trees, especially on
+	// network file systems. The predicate may then be called concurrently, from
+	// any of the threads, and may not throw. The files are added in the order
+	// of their paths.
 	TORRENT_EXPORT void add_files(file_storage& fs, std::string const& file
 		, std::function<bool(std::string)> p, create_flags_t flags = {});
+	TORRENT_EXPORT void add_files(file_storage& fs, std::string const& file
+		, std::function<bool(std::string)> p, create_flags_t flags, int num_threads);
 	TORRENT_EXPORT void add_files(file_storage& fs, std::string const& file
 		, create_flags_t flags = {});
 
@@ -466,6 +480,14 @@ namespace aux {
 	//
 	// The overloads taking a settings_pack may be used to configure the
 	// underlying disk access. Such as ``settings_pack::aio_threads``.
+	// ``settings_pack::hashing_threads`` sets the number of threads hashing
+	// pieces in parallel and ``settings_pack::checking_mem_usage`` the number
+	// of blocks to read ahead.
+	//
+	// The overload taking a ``skip`` predicate does not read or hash the
+	// pieces it returns true for. Their hashes are expected to already have
+	// been set, for instance from a cache of a previous run. ``f`` is only
+	// called for the pieces that are hashed.
 	//
 	// The overloads that don't take an ``error_code&`` may throw an exception in case of a
 	// file error, the other overloads sets the error code to reflect the error, if any.
@@ -474,6 +496,10 @@ namespace aux {
 	TORRENT_EXPORT void set_piece_hashes(create_torrent& t, std::string const& p
 		, settings_interface const& settings
 		, std::function<void(piece_index_t)> const& f, error_code& ec);
+	TORRENT_EXPORT void set_piece_hashes(create_torrent& t, std::string const& p
+		, settings_interface const& settings
+		, std::function<bool(piece_index_t)> const& skip
+		, std::function<void(piece_index_t)> const& f, error_code& ec);
 	inline void set_piece_hashes(create_torrent& t, std::string const& p, error_code& ec)
 	{
 		set_piece_hashes(t, p, aux::nop, ec);
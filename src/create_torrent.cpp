@@ -51,8 +51,13 @@ POSSIBILITY OF SUCH DAMAGE.
 #include <sys/types.h>
 #include <sys/stat.h>
 
+#include <algorithm>
+#include <condition_variable>
 #include <functional>
 #include <memory>
+#include <mutex>
+#include <thread>
+#include <vector>
 
 using namespace std::placeholders;
 
@@ -98,16 +103,30 @@ namespace {
 	}
 #endif
 
-	void add_files_impl(file_storage& fs, std::string const& p
+	struct scanned_file
+	{
+		// relative to the directory add_files() was called on
+		std::string path;
+		std::int64_t size = 0;
+		file_flags_t flags;
+		std::time_t mtime = 0;
+		std::string symlink;
+	};
+
+	// stats the file or directory ``l``, relative to ``p``. The entries of
+	// directories are appended to ``children`` and files are returned in
+	// ``file``. Returns true if ``l`` is a file to be added
+	bool scan_entry(std::string const& p
 		, std::string const& l, std::function<bool(std::string)> const& pred
-		, create_flags_t const flags)
+		, create_flags_t const flags, std::vector<std::string>& children
+		, scanned_file& file)
 	{
 		std::string const f = combine_path(p, l);
-		if (!pred(f)) return;
+		if (!pred(f)) return false;
 		error_code ec;
 		file_status s;
 		stat_file(f, &s, ec, (flags & create_torrent::symlinks) ? dont_follow_links : 0);
-		if (ec) return;
+		if (ec) return false;
 
 		// recurse into directories
 		bool recurse = (s.mode & file_status::directory) != 0;
@@ -125,26 +144,94 @@ namespace {
 			{
 				std::string const leaf = i.file();
 				if (ignore_subdir(leaf)) continue;
-				add_files_impl(fs, p, combine_path(l, leaf), pred, flags);
+				children.push_back(combine_path(l, leaf));
 			}
+			return false;
+		}
+
+		file.path = l;
+		file.flags = aux::get_file_attributes(f);
+		file.mtime = std::time_t(s.mtime);
+
+		// mask all bits to check if the file is a symlink
+		if ((file.flags & file_storage::flag_symlink)
+			&& (flags & create_torrent::symlinks))
+		{
+			file.symlink = aux::get_symlink_path(f);
 		}
 		else
 		{
-			// #error use the fields from s
-			file_flags_t const file_flags = aux::get_file_attributes(f);
+			file.size = s.file_size;
+		}
+		return true;
+	}
 
-			// mask all bits to check if the file is a symlink
-			if ((file_flags & file_storage::flag_symlink)
-				&& (flags & create_torrent::symlinks))
-			{
-				std::string const sym_path = aux::get_symlink_path(f);
-				fs.add_file(l, 0, file_flags, std::time_t(s.mtime), sym_path);
-			}
-			else
+	void add_file(file_storage& fs, scanned_file const& f)
+	{
+		if (f.symlink.empty())
+			fs.add_file(f.path, f.size, f.flags, f.mtime);
+		else
+			fs.add_file(f.path, 0, f.flags, f.mtime, f.symlink);
+	}
+
+	void add_files_impl(file_storage& fs, std::string const& p
+		, std::string const& l, std::function<bool(std::string)> const& pred
+		, create_flags_t const flags)
+	{
+		std::vector<std::string> children;
+		scanned_file file;
+		if (scan_entry(p, l, pred, flags, children, file))
+			add_file(fs, file);
+		for (auto const& c : children)
+			add_files_impl(fs, p, c, pred, flags);
+	}
+
+	// like add_files_impl(), but with a queue of entries to scan shared by
+	// num_threads threads. The files are sorted by path before being added, to
+	// not depend on the order the threads happen to finish in
+	void add_files_parallel(file_storage& fs, std::string const& p
+		, std::string const& l, std::function<bool(std::string)> const& pred
+		, create_flags_t const flags, int const num_threads)
+	{
+		std::mutex mutex;
+		std::condition_variable cond;
+		std::vector<std::string> queue{l};
+		// the number of entries queued or being scanned
+		int pending = 1;
+		std::vector<scanned_file> files;
+
+		auto worker = [&]
+		{
+			std::unique_lock<std::mutex> lock(mutex);
+			for (;;)
 			{
-				fs.add_file(l, s.file_size, file_flags, std::time_t(s.mtime));
+				cond.wait(lock, [&] { return !queue.empty() || pending == 0; });
+				if (queue.empty()) return;
+				std::string const entry = std::move(queue.back());
+				queue.pop_back();
+				lock.unlock();
+
+				std::vector<std::string> children;
+				scanned_file file;
+				bool const is_file = scan_entry(p, entry, pred, flags, children, file);
+
+				lock.lock();
+				if (is_file) files.push_back(std::move(file));
+				pending += int(children.size()) - 1;
+				for (auto& c : children) queue.push_back(std::move(c));
+				if (!children.empty() || pending == 0) cond.notify_all();
 			}
-		}
+		};
+
+		std::vector<std::thread> threads;
+		for (int i = 1; i < num_threads; ++i) threads.emplace_back(worker);
+		worker();
+		for (auto& t : threads) t.join();
+
+		std::sort(files.begin(), files.end()
+			, [](scanned_file const& lhs, scanned_file const& rhs)
+			{ return lhs.path < rhs.path; });
+		for (auto const& f : files) add_file(fs, f);
 	}
 
 	struct hash_state
@@ -156,8 +243,19 @@ namespace {
 		piece_index_t completed_piece;
 		std::function<void(piece_index_t)> const& f;
 		error_code& ec;
+		std::function<bool(piece_index_t)> const& skip;
+		int num_to_hash;
 	};
 
+	// advance piece_counter past pieces whose hashes the caller already has
+	void skip_pieces(hash_state* st)
+	{
+		if (!st->skip) return;
+		piece_index_t const end = st->ct.files().end_piece();
+		while (st->piece_counter < end && st->skip(st->piece_counter))
+			++st->piece_counter;
+	}
+
 	void on_hash(aux::vector<sha256_hash> v2_blocks, piece_index_t const piece
 		, sha1_hash const& piece_hash, storage_error const& error, hash_state* st)
 	{
@@ -206,6 +304,7 @@ namespace {
 
 		st->f(st->completed_piece);
 		++st->completed_piece;
+		skip_pieces(st);
 		if (st->piece_counter < st->ct.files().end_piece())
 		{
 			span<sha256_hash> v2_span(v2_blocks);
@@ -214,7 +313,7 @@ namespace {
 			++st->piece_counter;
 			st->iothread.submit_jobs();
 		}
-		else if (st->completed_piece == st->ct.files().end_piece())
+		else if (static_cast<int>(st->completed_piece) == st->num_to_hash)
 		{
 			st->iothread.abort(true);
 		}
@@ -270,6 +369,14 @@ namespace aux {
 			, default_pred, flags);
 	}
 
+	void add_files(file_storage& fs, std::string const& file
+		, std::function<bool(std::string)> p, create_flags_t const flags
+		, int const num_threads)
+	{
+		add_files_parallel(fs, parent_path(complete(file)), filename(file), p, flags
+			, num_threads);
+	}
+
 namespace {
 	struct disk_aborter
 	{
@@ -288,12 +395,22 @@ namespace {
 		aux::session_settings sett;
 		int const num_threads = std::max(1, static_cast<int>(std::thread::hardware_concurrency() / 2));
 		sett.set_int(settings_pack::hashing_threads, num_threads);
+		// read ahead 1 MiB
+		sett.set_int(settings_pack::checking_mem_usage, 1024 * 1024 / default_block_size);
 		set_piece_hashes(t, p, sett, f, ec);
 	}
 
 	void set_piece_hashes(create_torrent& t, std::string const& p
 		, settings_interface const& sett
 		, std::function<void(piece_index_t)> const& f, error_code& ec)
+	{
+		set_piece_hashes(t, p, sett, std::function<bool(piece_index_t)>(), f, ec);
+	}
+
+	void set_piece_hashes(create_torrent& t, std::string const& p
+		, settings_interface const& sett
+		, std::function<bool(piece_index_t)> const& skip
+		, std::function<void(piece_index_t)> const& f, error_code& ec)
 	{
 		// optimized path
 #ifdef TORRENT_BUILD_SIMULATOR
@@ -322,6 +439,14 @@ namespace {
 			return;
 		}
 
+		int num_to_hash = t.files().num_pieces();
+		if (skip)
+		{
+			for (piece_index_t const i : t.files().piece_range())
+				if (skip(i)) --num_to_hash;
+		}
+		if (num_to_hash == 0) return;
+
 		counters cnt;
 		int const num_threads = sett.get_int(settings_pack::hashing_threads);
 		std::unique_ptr<disk_interface> disk_thread = default_disk_io_constructor(ios, sett, cnt);
@@ -341,14 +466,20 @@ namespace {
 		storage_holder storage = disk_thread->new_torrent(params
 			, std::shared_ptr<void>());
 
-		// have 4 outstanding hash requests per thread, and no less than 1 MiB
+		// have 4 outstanding hash requests per thread, and no less than
+		// checking_mem_usage blocks
 		int const jobs_per_thread = 4;
 		int const piece_read_ahead = std::max(num_threads * jobs_per_thread
-			, 1 * 1024 * 1024 / t.piece_length());
+			, int(std::int64_t(sett.get_int(settings_pack::checking_mem_usage))
+				* default_block_size / t.piece_length()));
 
-		hash_state st = { t, std::move(storage), *disk_thread.get(), piece_index_t(0), piece_index_t(0), f, ec };
-		for (piece_index_t i(0); i < piece_index_t(piece_read_ahead); ++i)
+		hash_state st = { t, std::move(storage), *disk_thread.get(), piece_index_t(0), piece_index_t(0), f, ec
+			, skip, num_to_hash };
+		for (int i = 0; i < piece_read_ahead; ++i)
 		{
+			skip_pieces(&st);
+			if (st.piece_counter >= t.files().end_piece()) break;
+
 			aux::vector<sha256_hash> v2_blocks;
 
 			if (!t.is_v1_only())
@@ -360,10 +491,9 @@ namespace {
 			// the span needs to be created before the call to async_hash to ensure that
 			// it is constructed before the vector is moved into the bind context
 			span<sha256_hash> v2_span(v2_blocks);
-			disk_thread->async_hash(st.storage, i, v2_span, flags
+			disk_thread->async_hash(st.storage, st.piece_counter, v2_span, flags
 				, std::bind(&on_hash, std::move(v2_blocks), _1, _2, _3, &st));
 			++st.piece_counter;
-			if (st.piece_counter >= t.files().end_piece()) break;
 		}
 		disk_thread->submit_jobs();
 
@@ -941,6 +1071,27 @@ namespace {
 		fh[piece] = h;
 	}
 
+	sha1_hash create_torrent::hash(piece_index_t const index) const
+	{
+		TORRENT_ASSERT_PRECOND(index >= piece_index_t(0));
+		TORRENT_ASSERT_PRECOND(index < m_files.end_piece());
+		if (m_piece_hash.empty()) return sha1_hash();
+		return m_piece_hash[index];
+	}
+
+	sha256_hash create_torrent::hash2(file_index_t const file
+		, piece_index_t::diff_type const piece) const
+	{
+		TORRENT_ASSERT_PRECOND(file >= file_index_t(0));
+		TORRENT_ASSERT_PRECOND(file < m_files.end_file());
+		TORRENT_ASSERT_PRECOND(piece >= piece_index_t::diff_type(0));
+		TORRENT_ASSERT_PRECOND(piece < piece_index_t::diff_type(m_files.file_num_pieces(file)));
+		if (m_file_piece_hash.empty()) return sha256_hash();
+		auto const& fh = m_file_piece_hash[file];
+		if (fh.empty()) return sha256_hash();
+		return fh[piece];
+	}
+
 #if TORRENT_ABI_VERSION < 3
 	void create_torrent::set_file_hash(file_index_t index, sha1_hash const& h)
 	{
@@ -35,37 +35,352 @@ from __future__ import print_function
 # libtorrent session
 
 import os
+import re
 import sys
 import math
+import time
+import argparse
+from array import array
 from multiprocessing.pool import ThreadPool
 
+# numpy is required for derived metrics, such as rate(net.recv_bytes)
+try:
+    import numpy
+    from numpy.lib.stride_tricks import sliding_window_view
+    have_numpy = True
+except ImportError:
+    have_numpy = False
+
+# if numpy and matplotlib are available, the reports are rendered in-process
+# from a single memory mapped copy of the counters. Otherwise each report is
+# rendered by running gnuplot
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import EngFormatter
+    have_matplotlib = True
+except ImportError:
+    have_matplotlib = False
+
 thread_pool = ThreadPool(8)
 
-output_dir = 'session_stats_report'
+# the counters are stored in columnar form, one file per metric holding one
+# native int64 per sample. A report only has to read the handful of columns
+# it plots, and the files can be mmapped as-is. The time column holds the
+# timestamp of each sample, in milliseconds, if the log has them
 
-stat = open(sys.argv[1])
-line = stat.readline()
-print('looking for stats header')
-while 'session stats header:' not in line:
-    line = stat.readline()
+# the number of samples to buffer before appending them to the column files
+flush_samples = 4096
 
-print('found')
-keys = line.split('session stats header:')[1].strip().split(', ')
 
-try:
-    os.mkdir(output_dir)
-except Exception:
-    pass
-data_out = open(os.path.join(output_dir, 'counters.dat'), 'w+')
+def column_path(store, key):
+    return os.path.join(store, key + '.i64')
+
+
+def time_path(store):
+    return os.path.join(store, 'time.i64')
+
+
+def flush_columns(store, keys, samples, times):
+    num_keys = len(keys)
+    for i, k in enumerate(keys):
+        with open(column_path(store, k), 'ab') as f:
+            samples[i::num_keys].tofile(f)
+    with open(time_path(store), 'ab') as f:
+        times.tofile(f)
 
-idx = 0
-for line in stat:
-    if 'session stats (' not in line:
-        continue
-    data_out.write(("%d\t" % idx) + line.split(' values): ')[1].strip().replace(', ', '\t') + '\n')
-    idx += 1
 
-data_out.close()
+def keys_path(store):
+    return os.path.join(store, 'keys')
+
+
+def state_path(store):
+    return os.path.join(store, 'state')
+
+
+# the state is the offset into the log of the first line that hasn't been
+# ingested, and the number of samples in the store. It's only updated once
+# the samples have been appended to the columns
+def write_state(store, offset, num_samples):
+    with open(state_path(store) + '.tmp', 'w') as f:
+        f.write('%d %d\n' % (offset, num_samples))
+    os.replace(state_path(store) + '.tmp', state_path(store))
+
+
+def read_state(store):
+    try:
+        keys = open(keys_path(store)).read().split()
+        offset, num_samples = open(state_path(store)).read().split()
+        if not os.path.exists(time_path(store)):
+            return None
+        return keys, int(offset), int(num_samples)
+    except Exception:
+        return None
+
+
+# the lines logged by client_test start with the number of milliseconds since
+# the first alert, in brackets. Returns -1 if the line doesn't have one
+def parse_timestamp(line):
+    if not line.startswith(b'['):
+        return -1
+    try:
+        return int(line[1:line.index(b']')])
+    except ValueError:
+        return -1
+
+
+# appends the samples that were added to the log since the last call to the
+# store. Returns the keys, the number of samples that were in the store
+# already and the total number of samples, or None if the log doesn't have a
+# stats header (yet)
+def ingest(log_file, store):
+    state = read_state(store)
+    # if the log is smaller than what we've parsed, it has been replaced
+    if state is not None and os.path.getsize(log_file) < state[1]:
+        state = None
+
+    with open(log_file, 'rb') as stat:
+        if state is None:
+            print('looking for stats header')
+            offset = 0
+            for line in stat:
+                # the last line may still be being written
+                if not line.endswith(b'\n'):
+                    return None
+                offset += len(line)
+                if b'session stats header:' in line:
+                    break
+            else:
+                return None
+
+            print('found')
+            keys = line.split(b'session stats header:')[1].strip().decode().split(', ')
+
+            try:
+                os.makedirs(store)
+            except Exception:
+                pass
+            for f in os.listdir(store):
+                os.remove(os.path.join(store, f))
+            for k in keys:
+                open(column_path(store, k), 'wb').close()
+            open(time_path(store), 'wb').close()
+            with open(keys_path(store), 'w') as f:
+                f.write('\n'.join(keys) + '\n')
+            num_samples = 0
+            write_state(store, offset, num_samples)
+        else:
+            keys, offset, num_samples = state
+            # drop samples that were appended to the columns without making it
+            # into the state, e.g. because we were interrupted
+            if os.path.getsize(column_path(store, keys[0])) != num_samples * 8:
+                for k in keys:
+                    os.truncate(column_path(store, k), num_samples * 8)
+                os.truncate(time_path(store), num_samples * 8)
+            stat.seek(offset)
+
+        num_keys = len(keys)
+        first_new = num_samples
+        samples = array('q')
+        times = array('q')
+        for line in stat:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            if b'session stats (' not in line:
+                continue
+            values = line.split(b' values): ')[1].split(b',')
+            # skip lines that were truncated, e.g. by a crash
+            if len(values) != num_keys:
+                continue
+            samples.extend(map(int, values))
+            times.append(parse_timestamp(line))
+            num_samples += 1
+            if num_samples % flush_samples == 0:
+                flush_columns(store, keys, samples, times)
+                write_state(store, offset, num_samples)
+                samples = array('q')
+                times = array('q')
+
+    flush_columns(store, keys, samples, times)
+    write_state(store, offset, num_samples)
+    if num_samples > first_new:
+        print('%d new samples' % (num_samples - first_new))
+    return keys, first_new, num_samples
+
+
+def load_column(store, key, first, last):
+    ret = array('q')
+    with open(column_path(store, key), 'rb') as f:
+        f.seek(first * 8)
+        ret.frombytes(f.read((last - first) * 8))
+    return ret
+
+
+# writes the time of each sample (in milliseconds since the first one)
+# followed by the specified columns as rows of int64, or float64 if there are
+# derived metrics, for gnuplot to read as binary data. Returns the gnuplot
+# format of the rows
+def write_report_data(filename, run, lines, first, last):
+    if any(k not in run['keys'] for k in lines):
+        columns = [numpy.asarray(run['times'][first:last])] + [series(run, k, first, last) for k in lines]
+        numpy.column_stack(columns).astype(numpy.float64).tofile(filename)
+        return '%float64' * len(columns)
+
+    columns = [load_column(run['store'], k, first, last) for k in lines]
+    stride = len(columns) + 1
+    rows = array('q', bytes(8 * stride * (last - first)))
+    rows[0::stride] = run['times'][first:last]
+    for i, c in enumerate(columns):
+        rows[i + 1::stride] = c
+    with open(filename, 'wb') as f:
+        rows.tofile(f)
+    return '%int64' * stride
+
+
+# the columns may be longer than num_samples, if they're being appended to
+def load_matrix(store, keys, num_samples):
+    ret = {}
+    for k in keys:
+        if num_samples == 0:
+            ret[k] = numpy.zeros(0, dtype=numpy.int64)
+        else:
+            ret[k] = numpy.memmap(column_path(store, k), dtype=numpy.int64, mode='r', shape=(num_samples,))
+    return ret
+
+
+# returns the number of milliseconds since the first sample, for every
+# sample. If the log doesn't have timestamps, samples are assumed to be one
+# second apart
+def load_times(store, num_samples):
+    t = array('q')
+    with open(time_path(store), 'rb') as f:
+        t.frombytes(f.read(num_samples * 8))
+    if len(t) == 0 or min(t) < 0:
+        return array('q', range(0, len(t) * 1000, 1000))
+    return array('q', (v - t[0] for v in t))
+
+
+# everything the reports need to know about a run. The counters and the
+# elapsed time in seconds are only loaded if numpy is available
+def load_run(store, keys, num_samples, name=None):
+    run = {'name': name, 'store': store, 'keys': keys,
+           'times': load_times(store, num_samples)}
+    if have_numpy:
+        run['matrix'] = load_matrix(store, keys, num_samples)
+        run['elapsed'] = numpy.frombuffer(run['times'], dtype=numpy.int64) / 1000.
+    return run
+
+
+# derived metrics are specified as functions of a counter, or of another
+# derived metric:
+#
+#   rate(key)              the change since the previous sample
+#   avg(metric, window)    the moving average over the last window samples
+#   p<N>(metric, window)   the N:th percentile over the last window samples,
+#                          e.g. p99(disk.request_latency, 60)
+#
+# the samples before the first complete window (or interval) are NaN, and not
+# plotted. Returns the parsed metric, a key or a tuple of (function, metric,
+# window), or None if it's invalid or refers to a key that doesn't exist
+def parse_metric(spec, keys):
+    spec = spec.strip()
+    if spec in keys:
+        return spec
+    m = re.match(r'(rate|avg|p[0-9.]+)\((.*)\)$', spec)
+    if m is None:
+        return None
+    fun, arg = m.groups()
+    window = 1
+    if fun != 'rate':
+        arg, _, window = arg.rpartition(',')
+        try:
+            window = int(window)
+        except ValueError:
+            return None
+        if window < 1:
+            return None
+    arg = parse_metric(arg, keys)
+    if arg is None:
+        return None
+    return (fun, arg, window)
+
+
+# the number of rows of sliding windows to compute percentiles over at a time
+percentile_rows = 65536
+
+
+def evaluate(matrix, metric, first, last):
+    if not isinstance(metric, tuple):
+        return matrix[metric][first:last]
+
+    fun, arg, window = metric
+    # the samples before first that are needed to compute the first one
+    start = max(0, first - window)
+    y = evaluate(matrix, arg, start, last).astype(numpy.float64)
+    ret = numpy.full(len(y), numpy.nan)
+
+    if fun == 'rate':
+        ret[1:] = numpy.diff(y)
+    elif fun == 'avg':
+        # missing samples (e.g. the first one of a rate) don't count towards
+        # the average
+        total = numpy.concatenate(([0], numpy.cumsum(numpy.nan_to_num(y))))
+        count = numpy.concatenate(([0], numpy.cumsum(~numpy.isnan(y))))
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            ret[window - 1:] = (total[window:] - total[:-window]) / (count[window:] - count[:-window])
+    elif len(y) >= window:
+        q = float(fun[1:])
+        windows = sliding_window_view(y, window)
+        for i in range(0, len(windows), percentile_rows):
+            part = windows[i:i + percentile_rows]
+            ret[window - 1 + i:window - 1 + i + len(part)] = numpy.percentile(part, q, axis=1)
+
+    return ret[first - start:]
+
+
+# returns the samples [first, last) of a key or a derived metric of a run
+def series(run, spec, first, last):
+    return evaluate(run['matrix'], parse_metric(spec, run['keys']), first, last)
+
+
+parser = argparse.ArgumentParser(description='generate graphs from the session stats in a libtorrent log. If more '
+                                 'than one log is specified, the runs they were logged by are compared')
+parser.add_argument('log_files', metavar='log_file', nargs='+',
+                    help='the log of session_stats_header_alert and session_stats_alert messages')
+parser.add_argument('--output', default=None,
+                    help='the directory to write the reports to. Defaults to session_stats_report, or '
+                    'session_stats_comparison when comparing runs')
+parser.add_argument('--compare', choices=['overlay', 'diff'], default='overlay',
+                    help='when comparing runs, either draw every run in the same graph or draw the difference '
+                    'between each run and the first one')
+parser.add_argument('--gnuplot', action='store_true',
+                    help='render the reports with gnuplot, even if numpy and matplotlib are available')
+parser.add_argument('--follow', action='store_true',
+                    help='keep watching the log and update the reports as new samples are logged')
+parser.add_argument('--interval', type=float, default=5,
+                    help='the number of seconds between checking the log for new samples, in --follow mode')
+parser.add_argument('--metric', action='append', default=[],
+                    help='add a graph of the specified counter or derived metric, e.g. '
+                    '"p99(disk.request_latency, 60)". May be specified multiple times')
+parser.add_argument('--window', type=int, default=None,
+                    help='the number of samples covered by each generation of graphs. Only generations with '
+                    'new samples are rendered again. Defaults to 3600 in --follow mode, otherwise to a single '
+                    'generation covering the whole log')
+args = parser.parse_args()
+if args.window is None:
+    args.window = 3600 if args.follow else 0
+if args.follow and len(args.log_files) > 1:
+    parser.error('--follow only supports a single log')
+
+if args.output is not None:
+    output_dir = args.output
+elif len(args.log_files) > 1:
+    output_dir = 'session_stats_comparison'
+else:
+    output_dir = 'session_stats_report'
+store_dir = os.path.join(output_dir, 'counters')
 
 line_graph = 0
 histogram = 1
@@ -146,33 +461,38 @@ def to_title(key):
     return key.replace('_', ' ').replace('.', ' - ')
 
 
-def gen_report(name, unit, lines, short_unit, generation, log_file, options):
-    filename = os.path.join(output_dir, '%s_%04d.png' % (name, generation))
-    thumb = os.path.join(output_dir, '%s_%04d_thumb.png' % (name, generation))
-
-    # don't re-render a graph unless the logfile has changed
+def up_to_date(run, filename, thumb, last):
+    # don't re-render a graph unless it covers samples that were added since
+    # the last time, or the store has been rebuilt
+    if last > run['first_new']:
+        return False
     try:
         dst1 = os.stat(filename)
         dst2 = os.stat(thumb)
-        src = os.stat(log_file)
+        src = os.stat(keys_path(run['store']))
 
         if dst1.st_mtime > src.st_mtime and dst2.st_mtime > src.st_mtime:
             sys.stdout.write('.')
-            return None
+            return True
 
     except Exception:
         pass
+    return False
 
-    script = os.path.join(output_dir, '%s_%04d.gnuplot' % (name, generation))
-    out = open(script, 'w')
-    print("set term png size 1200,700", file=out)
-    print('set output "%s"' % filename, file=out)
-    if 'allow-negative' not in options:
-        print('set yrange [0:*]', file=out)
-    print("set tics nomirror", file=out)
-    print("set key box", file=out)
-    print("set key left top", file=out)
 
+def existing_keys(keys, lines):
+    ret = []
+    for k in lines:
+        if k not in keys and not have_numpy:
+            print('"%s" requires numpy' % k)
+        elif parse_metric(k, keys) is None:
+            print('"%s" not found' % k)
+        else:
+            ret.append(k)
+    return ret
+
+
+def report_colors(options):
     colors = graph_colors
     if options['type'] == line_graph:
         colors = line_colors
@@ -186,6 +506,38 @@ def gen_report(name, unit, lines, short_unit, generation, log_file, options):
             colors = gradient18_colors
     except Exception:
         pass
+    return colors
+
+
+def gen_report(run, name, unit, lines, short_unit, generation, first, last, options):
+    filename = os.path.join(output_dir, '%s_%04d.png' % (name, generation))
+    thumb = os.path.join(output_dir, '%s_%04d_thumb.png' % (name, generation))
+
+    if up_to_date(run, filename, thumb, last):
+        return None
+
+    lines = existing_keys(run['keys'], lines)
+    if not lines:
+        return None
+
+    # the report's columns, in the order of lines, start at column 2. Column
+    # 1 is the time in milliseconds
+    data_file = os.path.join(output_dir, '%s_%04d.dat' % (name, generation))
+    fmt = write_report_data(data_file, run, lines, first, last)
+    source = '"%s" binary format="%s"' % (data_file, fmt)
+    start = run['times'][first] / 1000.
+
+    script = os.path.join(output_dir, '%s_%04d.gnuplot' % (name, generation))
+    out = open(script, 'w')
+    print("set term png size 1200,700", file=out)
+    print('set output "%s"' % filename, file=out)
+    if 'allow-negative' not in options:
+        print('set yrange [0:*]', file=out)
+    print("set tics nomirror", file=out)
+    print("set key box", file=out)
+    print("set key left top", file=out)
+
+    colors = report_colors(options)
 
     if options['type'] == histogram:
         binwidth = options['binwidth']
@@ -198,85 +550,64 @@ def gen_report(name, unit, lines, short_unit, generation, log_file, options):
         print('set xlabel "%s"' % unit, file=out)
         print('set ylabel "number"', file=out)
 
-        k = lines[0]
-        try:
-            column = keys.index(k) + 2
-        except Exception:
-            print('"%s" not found' % k)
-            return
-        print('plot "%s" using (bin($%d,binwidth)):(1.0) smooth freq with boxes' % (log_file, column), file=out)
+        print('plot %s using (bin($2,binwidth)):(1.0) smooth freq with boxes' % source, file=out)
         print('', file=out)
         print('', file=out)
         print('', file=out)
 
     elif options['type'] == stacked:
-        print('set xrange [0:*]', file=out)
+        print('set xrange [%f:*]' % start, file=out)
         print('set ylabel "%s"' % unit, file=out)
         print('set xlabel "time (s)"', file=out)
         print('set format y "%%.1s%%c%s";' % short_unit, file=out)
         print('set style fill solid 1.0 noborder', file=out)
         print('plot', end=' ', file=out)
-        first = True
+        first_line = True
         graph = ''
         plot_expression = ''
         color = 0
-        for k in lines:
-            try:
-                column = keys.index(k) + 2
-            except Exception:
-                print('"%s" not found' % k)
-                continue
-            if not first:
+        for column, k in enumerate(lines, 2):
+            if not first_line:
                 plot_expression = ', ' + plot_expression
                 graph += '+'
             axis = 'x1y1'
             graph += '$%d' % column
-            plot_expression = ' "%s" using 1:(%s) title "%s" axes %s with filledcurves x1 lc rgb "%s"' % (
-                log_file, graph, to_title(k), axis, colors[color % len(colors)]) + plot_expression
-            first = False
+            plot_expression = ' %s using ($1/1000):(%s) title "%s" axes %s with filledcurves x1 lc rgb "%s"' % (
+                source, graph, to_title(k), axis, colors[color % len(colors)]) + plot_expression
+            first_line = False
             color += 1
         print(plot_expression, file=out)
     elif options['type'] == diff:
-        print('set xrange [0:*]', file=out)
+        print('set xrange [%f:*]' % start, file=out)
         print('set ylabel "%s"' % unit, file=out)
         print('set xlabel "time (s)"', file=out)
         print('set format y "%%.1s%%c%s";' % short_unit, file=out)
-        first = True
+        first_line = True
         graph = ''
         title = ''
-        for k in lines:
-            try:
-                column = keys.index(k) + 2
-            except Exception:
-                print('"%s" not found' % k)
-                continue
-            if not first:
+        for column, k in enumerate(lines, 2):
+            if not first_line:
                 graph += '-'
                 title += ' - '
             graph += '$%d' % column
             title += to_title(k)
-            first = False
-        print('plot "%s" using 1:(%s) title "%s" with step' % (log_file, graph, title), file=out)
+            first_line = False
+        print('plot %s using ($1/1000):(%s) title "%s" with step' % (source, graph, title), file=out)
     else:
-        print('set xrange [0:*]', file=out)
+        print('set xrange [%f:*]' % start, file=out)
         print('set ylabel "%s"' % unit, file=out)
         print('set xlabel "time (s)"', file=out)
         print('set format y "%%.1s%%c%s";' % short_unit, file=out)
         print('plot', end=' ', file=out)
-        first = True
+        first_line = True
         color = 0
-        for k in lines:
-            try:
-                column = keys.index(k) + 2
-            except Exception:
-                print('"%s" not found' % k)
-                continue
-            if not first:
+        for column, k in enumerate(lines, 2):
+            if not first_line:
                 print(', ', end=' ', file=out)
             axis = 'x1y1'
-            print(' "%s" using 1:%d title "%s" axes %s with steps lc rgb "%s"' %
-                  (log_file, column, to_title(k), axis, colors[color % len(colors)]), end=' ', file=out)
-            first = False
+            print(' %s using ($1/1000):%d title "%s" axes %s with steps lc rgb "%s"' %
+                  (source, column, to_title(k), axis, colors[color % len(colors)]), end=' ', file=out)
+            first_line = False
             color += 1
         print('', file=out)
 
@@ -298,7 +629,100 @@ def gen_report(name, unit, lines, short_unit, generation, log_file, options):
     return script
 
 
-def gen_html(reports, generations):
+# reduces a series to the min and max of each bucket of samples, with at most
+# width buckets. This preserves the peaks while drawing no more than about two
+# points per pixel
+def decimate(x, y, width):
+    n = -(-len(y) // width)
+    if n < 2:
+        return x, y
+    # repeating the last sample doesn't affect the min or max of its bucket
+    y = numpy.concatenate((y, numpy.full((-len(y)) % n, y[-1], dtype=y.dtype)))
+    buckets = y.reshape(-1, n)
+    # fmin and fmax ignore missing samples of derived metrics
+    envelope = numpy.column_stack((numpy.fmin.reduce(buckets, axis=1),
+                                   numpy.fmax.reduce(buckets, axis=1))).ravel()
+    return numpy.repeat(x[::n], 2), envelope
+
+
+def draw_report(ax, run, lines, options, colors, first, last, width):
+    columns = [series(run, k, first, last) for k in lines]
+    x = run['elapsed'][first:last]
+
+    if options['type'] == histogram:
+        binwidth = options['binwidth']
+        numbins = int(options['numbins'])
+        y = columns[0]
+        counts, edges = numpy.histogram(y[~numpy.isnan(y)], bins=numbins, range=(0, binwidth * numbins))
+        ax.bar(edges[:-1], counts, width=binwidth, align='edge', color=colors[0])
+        ax.set_xlim(0, binwidth * numbins)
+        return
+
+    if options['type'] == stacked:
+        # every layer is at least as large as the one below it, in every
+        # sample, so the decimated layers don't overlap either
+        stack = numpy.cumsum(numpy.vstack(columns), axis=0)
+        lower = numpy.zeros(len(x), dtype=numpy.int64)
+        for i, k in enumerate(lines):
+            xs, upper = decimate(x, stack[i], width)
+            ax.fill_between(xs, decimate(x, lower, width)[1], upper, step='post', linewidth=0,
+                            color=colors[i % len(colors)], label=to_title(k))
+            lower = stack[i]
+    elif options['type'] == diff:
+        y = columns[0] - sum(columns[1:])
+        ax.step(*decimate(x, y, width), where='post', label=' - '.join(to_title(k) for k in lines))
+    else:
+        for i, k in enumerate(lines):
+            ax.step(*decimate(x, columns[i], width), where='post',
+                    color=colors[i % len(colors)], label=to_title(k))
+    ax.set_xlim(left=x[0])
+
+
+# renders the same graphs as gen_report, from the memory mapped counters
+def render_report(run, name, unit, lines, short_unit, generation, first, last, options):
+    filename = os.path.join(output_dir, '%s_%04d.png' % (name, generation))
+    thumb = os.path.join(output_dir, '%s_%04d_thumb.png' % (name, generation))
+
+    if up_to_date(run, filename, thumb, last):
+        return
+
+    lines = existing_keys(run['keys'], lines)
+    if not lines:
+        return
+
+    colors = report_colors(options)
+
+    fig = Figure(figsize=(12, 7), dpi=100)
+    ax = fig.add_subplot()
+    draw_report(ax, run, lines, options, colors, first, last, 1200)
+    if 'allow-negative' not in options:
+        ax.set_ylim(bottom=0)
+    if options['type'] == histogram:
+        ax.set_xlabel(unit)
+        ax.set_ylabel('number')
+    else:
+        ax.set_xlabel('time (s)')
+        ax.set_ylabel(unit)
+        ax.yaxis.set_major_formatter(EngFormatter(unit=short_unit.replace('%%', '%')))
+        ax.legend(loc='upper left')
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    fig.savefig(filename)
+
+    fig = Figure(figsize=(1.5, 1), dpi=100)
+    ax = fig.add_axes((0, 0, 1, 1))
+    draw_report(ax, run, lines, options, colors, first, last, 150)
+    if 'allow-negative' not in options:
+        ax.set_ylim(bottom=0)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    fig.savefig(thumb)
+
+    sys.stdout.write('.')
+    sys.stdout.flush()
+
+
+def gen_html(reports, generations, summary=''):
     file = open(os.path.join(output_dir, 'index.html'), 'w+')
 
     css = '''img { margin: 0}
@@ -308,6 +732,7 @@ h1 { line-height: 1; display: inline }
 h2 { line-height: 1; display: inline; font-size: 1em; font-weight: normal};'''
 
     print('<html><head><style type="text/css">%s</style></head><body>' % css, file=file)
+    print(summary, file=file)
 
     for i in reports:
         print('<div id="head"><h1>%s </h1><h2>%s</h2><div><div id="graphs">' % (i[0], i[3]), file=file)
@@ -521,6 +946,20 @@ reports = [
     ], {'type': stacked, 'colors': 'gradient18'}),
 
     ('request latency', 'us', '', 'latency from receiving requests to sending response', ['disk.request_latency']),
+    ('request latency percentiles', 'us', '', 'latency from receiving requests to sending response, over a minute', [
+        'p50(disk.request_latency, 60)',
+        'p95(disk.request_latency, 60)',
+        'p99(disk.request_latency, 60)'
+    ]),
+    ('transfer rate', 'rate', 'B/s', 'bytes sent and received per second, averaged over 10 seconds', [
+        'avg(rate(net.recv_bytes), 10)',
+        'avg(rate(net.sent_bytes), 10)'
+    ]),
+    ('waste rate', 'rate', 'B/s', 'wasted bytes received per second', [
+        'rate(net.recv_failed_bytes)',
+        'rate(net.recv_redundant_bytes)',
+        'rate(net.recv_ip_overhead_bytes)'
+    ], {'type': stacked}),
     ('incoming messages', 'num', '', 'number of received bittorrent messages, by type', [ \
         'ses.num_incoming_choke', \
         'ses.num_incoming_unchoke', \
@@ -621,30 +1060,262 @@ reports = [
     #  {'type': histogram, 'binwidth': 5, 'numbins': 120})
 ]
 
-print('generating graphs')
-g = 0
-generations = []
-scripts = []
+for m in args.metric:
+    reports.append((m, 'value', '', m, [m]))
+
+use_matplotlib = have_numpy and have_matplotlib and not args.gnuplot
 
-print('[%s] %04d\r[' % (' ' * len(reports), g), end='')
-for i in reports:
+
+def report_options(report):
     try:
-        options = i[5]
+        options = report[5]
     except Exception:
         options = {}
     if 'type' not in options:
         options['type'] = line_graph
+    return options
+
+
+# renders every generation that has new samples, i.e. samples from first_new
+# and on. With a window, generation g covers the samples
+# [g * window, (g + 1) * window)
+def render(store, keys, first_new, num_samples):
+    run = load_run(store, keys, num_samples)
+    run['first_new'] = first_new
+
+    print('generating graphs')
+    generations = []
+    scripts = []
+
+    window = args.window if args.window > 0 else max(num_samples, 1)
+    for g in range(max(1, -(-num_samples // window))):
+        first = g * window
+        last = min(num_samples, first + window)
+        print('[%s] %04d\r[' % (' ' * len(reports), g), end='')
+        for i in reports:
+            options = report_options(i)
+
+            if use_matplotlib:
+                render_report(run, i[0], i[1], i[4], i[2], g, first, last, options)
+                continue
+
+            script = gen_report(run, i[0], i[1], i[4], i[2], g, first, last, options)
+            if script is not None:
+                scripts.append(script)
+
+        generations.append(g)
+
+    # run gnuplot on all scripts, in parallel
+    thread_pool.map(plot_fun, scripts)
+
+    print('\ngenerating html')
+    gen_html(reports, generations)
+
+
+# the runs are named after their logs or, if they have the same name (e.g.
+# events.log), after the directories they're in
+def run_names(log_files):
+    names = [os.path.splitext(os.path.basename(f))[0] for f in log_files]
+    if len(set(names)) < len(names):
+        names = [os.path.basename(os.path.dirname(os.path.abspath(f))) for f in log_files]
+    if len(set(names)) < len(names):
+        names = ['%d_%s' % (i, n) for i, n in enumerate(names)]
+    return names
+
+
+# returns the samples of a key or derived metric of a run, at the elapsed
+# times of grid. Samples are held until the next one, and times after the end
+# of the run are NaN
+def align(run, spec, grid):
+    elapsed = run['elapsed']
+    y = series(run, spec, 0, len(elapsed)).astype(numpy.float64)
+    idx = numpy.searchsorted(elapsed, grid, side='right') - 1
+    ret = y[numpy.maximum(idx, 0)]
+    ret[(idx < 0) | (grid > elapsed[-1])] = numpy.nan
+    return ret
+
+
+run_line_styles = ['-', '--', ':', '-.']
+
+
+def draw_comparison(ax, lines, options, colors, runs, grid, width):
+    # with one series per run, the runs are told apart by color, otherwise by
+    # line style. Stacked reports are drawn as separate lines, since filled
+    # areas would hide each other
+    def series_of(run):
+        if options['type'] == diff:
+            y = align(run, lines[0], grid) - sum(align(run, k, grid) for k in lines[1:])
+            return [(' - '.join(to_title(k) for k in lines), y)]
+        return [(to_title(k), align(run, k, grid)) for k in lines]
+
+    base_name = runs[0]['name']
+    base = series_of(runs[0])
+    if args.compare == 'diff':
+        runs = runs[1:]
+    for r, run in enumerate(runs):
+        data = series_of(run)
+        if args.compare == 'diff':
+            data = [(title, y - b) for (title, y), (_, b) in zip(data, base)]
+            name = '%s - %s' % (run['name'], base_name)
+        else:
+            name = run['name']
+
+        for i, (title, y) in enumerate(data):
+            color = colors[(r if len(data) == 1 else i) % len(colors)]
+            style = run_line_styles[0 if len(data) == 1 else r % len(run_line_styles)]
+            label = '%s: %s' % (name, title)
+            if options['type'] == histogram:
+                binwidth = options['binwidth']
+                numbins = int(options['numbins'])
+                counts, edges = numpy.histogram(y[~numpy.isnan(y)], bins=numbins, range=(0, binwidth * numbins))
+                ax.stairs(counts, edges, color=color, linestyle=style, label=label)
+            else:
+                ax.step(*decimate(grid, y, width), where='post', color=color, linestyle=style, label=label)
+
+
+def render_comparison(name, unit, lines, short_unit, options, runs, grid):
+    filename = os.path.join(output_dir, '%s_0000.png' % name)
+    thumb = os.path.join(output_dir, '%s_0000_thumb.png' % name)
+
+    # all runs must have the metrics
+    for run in runs:
+        lines = existing_keys(run['keys'], lines)
+    if not lines:
+        return
+
+    colors = report_colors(options)
+
+    fig = Figure(figsize=(12, 7), dpi=100)
+    ax = fig.add_subplot()
+    draw_comparison(ax, lines, options, colors, runs, grid, 1200)
+    if 'allow-negative' not in options and args.compare == 'overlay':
+        ax.set_ylim(bottom=0)
+    if options['type'] == histogram:
+        ax.set_xlabel(unit)
+        ax.set_ylabel('number')
+    else:
+        ax.set_xlim(left=0)
+        ax.set_xlabel('elapsed time (s)')
+        ax.set_ylabel(unit)
+        ax.yaxis.set_major_formatter(EngFormatter(unit=short_unit.replace('%%', '%')))
+    ax.legend(loc='upper left')
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+    fig.savefig(filename)
+
+    fig = Figure(figsize=(1.5, 1), dpi=100)
+    ax = fig.add_axes((0, 0, 1, 1))
+    draw_comparison(ax, lines, options, colors, runs, grid, 150)
+    if 'allow-negative' not in options and args.compare == 'overlay':
+        ax.set_ylim(bottom=0)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    fig.savefig(thumb)
 
-    script = gen_report(i[0], i[1], i[4], i[2], g, os.path.join(output_dir, 'counters.dat'), options)
-    if script is not None:
-        scripts.append(script)
+    sys.stdout.write('.')
+    sys.stdout.flush()
 
-generations.append(g)
-g += 1
 
-# run gnuplot on all scripts, in parallel
-thread_pool.map(plot_fun, scripts)
-scripts = []
+def si_format(v, unit):
+    prefix = ''
+    for p in ['k', 'M', 'G', 'T']:
+        if abs(v) < 1000:
+            break
+        v /= 1000.
+        prefix = p
+    return '%.1f %s%s' % (v, prefix, unit)
 
-print('\ngenerating html')
-gen_html(reports, generations)
+
+# returns the mean rates over the whole run and the proportion of the disk
+# job time spent reading, writing and hashing
+def summarize(run):
+    def delta(key):
+        if key not in run['keys']:
+            return None
+        c = run['matrix'][key]
+        return float(c[-1] - c[0])
+
+    duration = run['elapsed'][-1]
+    ret = [run['name'], '%d' % len(run['elapsed']), '%.0f s' % duration]
+    for k in ['net.recv_payload_bytes', 'net.sent_payload_bytes']:
+        d = delta(k)
+        ret.append('n/a' if d is None or duration <= 0 else si_format(d / duration, 'B/s'))
+    job_time = delta('disk.disk_job_time')
+    for k in ['disk.disk_read_time', 'disk.disk_write_time', 'disk.disk_hash_time']:
+        d = delta(k)
+        ret.append('n/a' if d is None or not job_time else '%.1f %%' % (d * 100. / job_time))
+    return ret
+
+
+summary_columns = ['run', 'samples', 'duration', 'download', 'upload', 'disk read', 'disk write', 'disk hash']
+
+
+def compare(log_files):
+    if not have_numpy or not have_matplotlib:
+        print('comparing runs requires numpy and matplotlib')
+        sys.exit(1)
+
+    runs = []
+    for name, log_file in zip(run_names(log_files), log_files):
+        print('ingesting %s' % log_file)
+        store = os.path.join(output_dir, 'runs', name)
+        state = ingest(log_file, store)
+        if state is None:
+            print('no stats header found in %s' % log_file)
+            sys.exit(1)
+        run_keys, _, num_samples = state
+        if num_samples == 0:
+            print('no stats samples found in %s' % log_file)
+            sys.exit(1)
+        runs.append(load_run(store, run_keys, num_samples, name))
+
+    # the runs are sampled at the interval of the first one, from when each
+    # of them logged its first sample
+    intervals = numpy.diff(runs[0]['elapsed'])
+    interval = numpy.median(intervals) if len(intervals) > 0 else 1.
+    if interval <= 0:
+        interval = 1.
+    end = max(run['elapsed'][-1] for run in runs)
+    grid = numpy.arange(0, end + interval / 2, interval)
+
+    print('generating graphs')
+    print('[%s]\r[' % (' ' * len(reports)), end='')
+    for i in reports:
+        render_comparison(i[0], i[1], i[4], i[2], report_options(i), runs, grid)
+
+    rows = [summarize(run) for run in runs]
+    widths = [max(len(r[c]) for r in rows + [summary_columns]) for c in range(len(summary_columns))]
+    print('\n')
+    for r in [summary_columns] + rows:
+        print('  '.join(v.ljust(w) for v, w in zip(r, widths)))
+
+    summary = '<table border="1" cellspacing="0" cellpadding="3"><tr>%s</tr>' % \
+        ''.join('<th>%s</th>' % c for c in summary_columns)
+    for r in rows:
+        summary += '<tr>%s</tr>' % ''.join('<td>%s</td>' % v for v in r)
+    summary += '</table>'
+
+    print('\ngenerating html')
+    gen_html(reports, [0], summary)
+
+
+if len(args.log_files) > 1:
+    compare(args.log_files)
+    sys.exit(0)
+
+rendered = False
+while True:
+    state = ingest(args.log_files[0], store_dir)
+    if state is None and not args.follow:
+        print('no stats header found')
+        sys.exit(1)
+
+    if state is not None:
+        keys, first_new, num_samples = state
+        if num_samples > 0 and (num_samples > first_new or not rendered):
+            render(store_dir, keys, first_new, num_samples)
+            rendered = True
+
+    if not args.follow:
+        break
+    time.sleep(args.interval)